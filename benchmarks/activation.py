@@ -0,0 +1,81 @@
+"""
+Measure what the plugin costs poetry commands which don't modify the lock file.
+
+Poetry loads and activates every installed plugin on each invocation, including
+`poetry run` and `poetry --version`. This script times, in fresh interpreters:
+
+- importing `poetry_auto_export`, after the modules poetry itself loads first,
+- `PoetryAutoExport.activate` on a poetry `Application`,
+- handling the TERMINATE event of a command that doesn't modify the lock file,
+
+and lists the modules the plugin imports on top of poetry's own.
+
+Usage:
+```
+python benchmarks/activation.py [--runs N]
+```
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+MEASURE = """
+import json, sys, time
+from cleo.events.console_terminate_event import ConsoleTerminateEvent
+from cleo.io.null_io import NullIO
+from poetry.console.application import Application
+from poetry.console.commands.run import RunCommand
+
+before = set(sys.modules)
+start = time.perf_counter()
+from poetry_auto_export import PoetryAutoExport
+imported = time.perf_counter()
+
+application = Application()
+plugin = PoetryAutoExport()
+start_activate = time.perf_counter()
+plugin.activate(application)
+activated = time.perf_counter()
+
+event = ConsoleTerminateEvent(RunCommand(), NullIO(), 0)
+start_terminate = time.perf_counter()
+plugin.run_exports(event, "", application.event_dispatcher)
+terminated = time.perf_counter()
+
+print(json.dumps({
+    "import": imported - start,
+    "activate": activated - start_activate,
+    "terminate": terminated - start_terminate,
+    "modules": sorted(set(sys.modules) - before),
+}))
+"""
+
+
+def measure_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+def main(runs: int = 10):
+    samples = [measure_once() for _ in range(runs)]
+    for phase in ("import", "activate", "terminate"):
+        timings = [sample[phase] * 1000 for sample in samples]
+        print(
+            f"{phase:>10}: median {statistics.median(timings):.3f} ms,"
+            f" max {max(timings):.3f} ms"
+        )
+    modules = samples[0]["modules"]
+    listed = ", ".join(modules[:10]) + (", ..." if len(modules) > 10 else "")
+    print(f"Modules imported by the plugin ({len(modules)}): {listed}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(__doc__)
+        sys.exit(0)
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[1] == "--runs" else 10
+    main(runs)
@@ -0,0 +1,442 @@
+"""
+Benchmark the export pipeline on synthetic projects with large lock files.
+
+For each size, a poetry project is generated in a temporary directory, with a
+`poetry.lock` of that many packages spread over several dependency groups and
+extras, each with a long list of file hashes. Everything runs offline. This
+script times:
+
+- `PoetryAutoExport.activate` on a poetry `Application`,
+- `_compute_poetry_lock_hash`,
+- `run_exports` after `poetry lock`, with 1 and with 10 export targets,
+- `run_exports` with 10 incremental export targets, after one package changed,
+- writing an export with its header (`_format_header` and `_write_export`),
+- the standalone `check_requirements_file.py`, including interpreter startup,
+- the `poetry-auto-export-check` entry point, over the startup of a bare
+  interpreter, and the import of the checker alone, which must stay within
+  `CHECKER_BUDGET_MS` whatever the size of the lock file,
+- the peak memory (RSS) of a fresh interpreter exporting 10 targets, in MB, and
+  the peak of what the exports allocated on top of poetry with its lock file
+  loaded, as traced by `tracemalloc`.
+
+The medians are compared with `benchmarks/baseline.json`, which is updated with
+`--save`. With `--check`, the script fails if any benchmark got slower than the
+baseline by more than the tolerance factor and by more than `NOISE_FLOOR`, or if
+the checker is over budget.
+
+Usage:
+```
+python benchmarks/pipeline.py [--runs N] [--sizes 50,500,5000] [--save | --check] [--tolerance 2.0]
+```
+"""
+
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).parent
+BASELINE_FILE = BENCHMARKS_DIR / "baseline.json"
+CHECKER = BENCHMARKS_DIR.parent / "poetry_auto_export/check_requirements_file.py"
+# What importing the checker may add to the startup of the interpreter, on every
+# commit. Hashing poetry.lock comes on top, and grows with its size.
+CHECKER_BUDGET_MS = 10.0
+# Differences smaller than this, in ms or MB, are noise whatever their ratio, e.g.
+# for `activate`, which takes microseconds.
+NOISE_FLOOR = 1.0
+# As the console script runs it, from its compiled module and without site-packages.
+CHECKER_ENTRY_POINT = (
+    "import sys; sys.path.insert(0, sys.argv.pop(1)); "
+    "from poetry_auto_export.check_requirements_file import main; sys.exit(main())"
+)
+CHECKER_IMPORT = (
+    "import sys; sys.path.insert(0, sys.argv.pop(1)); "
+    "import poetry_auto_export.check_requirements_file"
+)
+# Benchmark the plugin from this checkout, even if another version is installed.
+sys.path.insert(0, str(BENCHMARKS_DIR.parent))
+
+SIZES = (50, 500, 5000)
+GROUPS = ("main", "dev", "test", "docs", "lint", "typing", "bench", "release")
+EXTRAS = tuple(f"extra-{i}" for i in range(6))
+WHEEL_TAGS = tuple(
+    f"{python}-{python}-{platform_tag}"
+    for python in ("cp310", "cp311", "cp312", "cp313")
+    for platform_tag in (
+        "manylinux_2_17_x86_64",
+        "manylinux_2_17_aarch64",
+        "macosx_11_0_arm64",
+        "win_amd64",
+    )
+)
+
+# Exports 10 targets in a fresh interpreter, printing its peak RSS and the peak
+# traced allocations of the exports.
+PEAK_RSS = """
+import json, resource, sys, tracemalloc
+sys.path.insert(0, sys.argv[1])
+from cleo.io.null_io import NullIO
+from poetry.console.application import Application
+from poetry_auto_export.config import Export
+from poetry_auto_export.plugin import PoetryAutoExport
+
+application = Application()
+application.poetry.locker.lock_data  # loaded by poetry itself before the plugin runs
+tracemalloc.start()
+plugin = PoetryAutoExport()
+plugin.activate(application)
+plugin.configs = [Export.from_config(target) for target in json.loads(sys.argv[2])]
+if plugin.export_all(NullIO(), "lock"):
+    raise RuntimeError("Export failed")
+_, export_peak = tracemalloc.get_traced_memory()
+# `ru_maxrss` is in bytes on macOS, and in kilobytes elsewhere.
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps([rss * (1 if sys.platform == "darwin" else 1024), export_peak]))
+"""
+MEMORY_BENCHMARKS = ("peak_rss", "export_peak")
+
+# Ten targets, as a project exporting for several environments might have.
+TARGETS = [
+    {"output": "requirements.txt"},
+    {"output": "requirements-dev.txt", "with": ["dev", "test"]},
+    {"output": "requirements-docs.txt", "only": ["docs"]},
+    {"output": "requirements-lint.txt", "only": ["lint", "typing"]},
+    {"output": "requirements-all.txt", "with": list(GROUPS[1:]), "all_extras": True},
+    {"output": "requirements-extras.txt", "extras": ["extra-0", "extra-1"]},
+    {"output": "requirements-nohashes.txt", "without_hashes": True},
+    {"output": "constraints.txt", "format": "constraints.txt", "with": ["dev"]},
+    {"output": "requirements-bench.txt", "with": ["bench"], "without": ["main"]},
+    {"output": "requirements-release.txt", "only": ["release"], "without_urls": True},
+]
+
+
+def generate_project(directory: Path, size: int):
+    """Write a `pyproject.toml` and a lock 2.1 `poetry.lock` with `size` packages.
+
+    The first fifth of the packages are direct dependencies, spread round-robin over
+    the groups; every tenth of those is an optional dependency behind an extra, and
+    every seventh is Windows-only. Every other package is a transitive dependency,
+    chained below one of the direct dependencies.
+    """
+    roots = max(size // 5, len(GROUPS))
+    names = [f"pkg-{i:05d}" for i in range(size)]
+    versions = [f"1.{i % 10}.{i % 7}" for i in range(size)]
+
+    def root_group(root: int) -> str:
+        return "main" if root % 10 == 9 else GROUPS[root % len(GROUPS)]
+
+    def root_marker(root: int) -> str | None:
+        markers = []
+        if root % 10 == 9:
+            markers.append(f'extra == "{EXTRAS[root // 10 % len(EXTRAS)]}"')
+        if root % 7 == 3:
+            markers.append('sys_platform == "win32"')
+        return " and ".join(markers) or None
+
+    dependencies: dict[str, list[str]] = {group: [] for group in GROUPS}
+    extras: dict[str, list[str]] = {extra: [] for extra in EXTRAS}
+    for root in range(roots):
+        if root % 10 == 9:
+            extras[EXTRAS[root // 10 % len(EXTRAS)]].append(names[root])
+            dependencies["main"].append(
+                f'{names[root]} = {{version = "*", optional = true}}'
+            )
+        else:
+            dependencies[root_group(root)].append(f'{names[root]} = "*"')
+
+    pyproject = [
+        "[tool.poetry]",
+        'name = "synthetic"',
+        'version = "0.1.0"',
+        'description = "A synthetic project for benchmarks"',
+        'authors = ["benchmark@example.com"]',
+        "",
+        "[tool.poetry.dependencies]",
+        'python = "^3.10"',
+        *dependencies["main"],
+    ]
+    for group in GROUPS[1:]:
+        pyproject += ["", f"[tool.poetry.group.{group}.dependencies]"]
+        pyproject += dependencies[group]
+    pyproject += ["", "[tool.poetry.extras]"]
+    pyproject += [
+        f"{extra} = {json.dumps(members)}" for extra, members in extras.items()
+    ]
+    (directory / "pyproject.toml").write_text("\n".join(pyproject) + "\n")
+    # Exports refuse a lock file which is out of date with pyproject.toml.
+    from poetry.factory import Factory
+
+    content_hash = Factory().create_poetry(directory).locker._content_hash
+
+    lock = []
+    for i in range(size):
+        root = i % roots
+        files = [f"{names[i].replace('-', '_')}-{versions[i]}.tar.gz"] + [
+            f"{names[i].replace('-', '_')}-{versions[i]}-{tag}.whl"
+            for tag in WHEEL_TAGS
+        ]
+        lock += [
+            "[[package]]",
+            f'name = "{names[i]}"',
+            f'version = "{versions[i]}"',
+            f'description = "Synthetic package number {i}"',
+            f"optional = {'true' if root % 10 == 9 else 'false'}",
+            'python-versions = ">=3.8"',
+            f'groups = ["{root_group(root)}"]',
+        ]
+        if marker := root_marker(root):
+            lock.append(f"markers = {json.dumps(marker)}")
+        lock.append("files = [")
+        for file in files:
+            digest = hashlib.sha256(file.encode()).hexdigest()
+            lock.append(f'    {{file = "{file}", hash = "sha256:{digest}"}},')
+        lock.append("]")
+        if i + roots < size:
+            lock += ["", "[package.dependencies]", f'{names[i + roots]} = "*"']
+        lock.append("")
+    lock += [
+        "[metadata]",
+        'lock-version = "2.1"',
+        'python-versions = "^3.10"',
+        f'content-hash = "{content_hash}"',
+    ]
+    (directory / "poetry.lock").write_text("\n".join(lock) + "\n")
+
+
+def timed(function, runs: int, setup=None) -> float:
+    """Median duration of `function()` in milliseconds, calling `setup()` before each run."""
+    timings = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure(size: int, runs: int) -> dict[str, float]:
+    from cleo.events.console_command_event import ConsoleCommandEvent
+    from cleo.events.console_terminate_event import ConsoleTerminateEvent
+    from cleo.io.null_io import NullIO
+    from poetry.console.application import Application
+    from poetry.console.commands.lock import LockCommand
+
+    from poetry_auto_export.config import Export
+    from poetry_auto_export.plugin import PoetryAutoExport
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        project = Path(directory)
+        generate_project(project, size)
+        cwd = os.getcwd()
+        os.chdir(project)
+        try:
+            application = Application()
+            # Load poetry, as poetry itself does before the plugin runs
+            _ = application.poetry
+
+            def activate() -> PoetryAutoExport:
+                plugin = PoetryAutoExport()
+                plugin.activate(application)
+                return plugin
+
+            results["activate"] = timed(activate, runs)
+
+            plugin = activate()
+            results["lock_hash"] = timed(plugin._compute_poetry_lock_hash, runs)
+
+            def clean():
+                for target in TARGETS:
+                    Path(target["output"]).unlink(missing_ok=True)
+                # Poetry reads poetry.lock again after writing it
+                application.poetry.locker._lock_data = None
+
+            def export(plugin: PoetryAutoExport, targets: list[dict]):
+                plugin.configs = [Export.from_config(target) for target in targets]
+                event = ConsoleTerminateEvent(LockCommand(), NullIO(), 0)
+                plugin.run_exports(event, "", application.event_dispatcher)
+                if event.exit_code:
+                    raise RuntimeError(f"Export of {len(targets)} targets failed")
+
+            for count in (1, 10):
+                results[f"run_exports[{count}]"] = timed(
+                    lambda count=count: export(activate(), TARGETS[:count]), runs, clean
+                )
+
+            incremental_targets = [
+                {**target, "incremental": True} for target in TARGETS
+            ]
+            prepared: list[PoetryAutoExport] = []
+
+            def change_one_package():
+                """Export, then bump one package in poetry.lock as `poetry add` would."""
+                clean()
+                export(activate(), incremental_targets)
+                plugin = activate()
+                plugin.configs = [
+                    Export.from_config(target) for target in incremental_targets
+                ]
+                command = ConsoleCommandEvent(LockCommand(), NullIO())
+                plugin.remember_lock(command, "", application.event_dispatcher)
+                lock = Path("poetry.lock")
+                old, new = 'version = "1.1.1"', 'version = "1.1.9"'
+                text = lock.read_text()
+                lock.write_text(
+                    text.replace(old, new, 1)
+                    if old in text
+                    else text.replace(new, old, 1)
+                )
+                application.poetry.locker._lock_data = None
+                prepared.append(plugin)
+
+            results["incremental[10]"] = timed(
+                lambda: export(prepared.pop(), incremental_targets),
+                runs,
+                change_one_package,
+            )
+
+            lock_hash = plugin._compute_poetry_lock_hash()
+            content = Path("requirements.txt").read_text()
+
+            def write_header():
+                header = plugin._format_header(lock_hash, lock_hash)
+                plugin._write_export(Path("requirements.txt"), header + content)
+
+            results["header_write"] = timed(write_header, runs, clean)
+
+            def check():
+                subprocess.run([sys.executable, CHECKER], check=True)
+
+            results["checker"] = timed(check, runs)
+
+            def run_python(*args: str):
+                subprocess.run([sys.executable, "-S", "-I", *args], check=True)
+
+            bare = timed(lambda: run_python("-c", "pass"), runs)
+            for name, code in (
+                ("checker_overhead", CHECKER_ENTRY_POINT),
+                ("checker_import", CHECKER_IMPORT),
+            ):
+                results[name] = (
+                    timed(
+                        lambda code=code: run_python(
+                            "-c", code, str(CHECKER.parent.parent)
+                        ),
+                        runs,
+                    )
+                    - bare
+                )
+
+            if sys.platform != "win32":
+                clean()
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        "-c",
+                        PEAK_RSS,
+                        str(BENCHMARKS_DIR.parent),
+                        json.dumps(TARGETS),
+                    ],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                peak_rss, export_peak = (value / 2**20 for value in json.loads(output))
+                results["peak_rss"] = peak_rss
+                results["export_peak"] = export_peak
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float):
+    """Print the results next to the baseline, returning the regressed benchmarks."""
+    regressions = []
+    for name, value in results.items():
+        unit = "MB" if name.startswith(MEMORY_BENCHMARKS) else "ms"
+        line = f"{name:>28}: {value:10.3f} {unit}"
+        if name in baseline:
+            ratio = value / baseline[name]
+            line += f"  ({ratio:.2f}x baseline)"
+            if ratio > tolerance and value - baseline[name] > NOISE_FLOOR:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main(
+    runs: int = 5,
+    sizes: tuple[int, ...] = SIZES,
+    save: bool = False,
+    check: bool = False,
+    tolerance: float = 2.0,
+) -> int:
+    results = {}
+    for size in sizes:
+        for name, value in measure(size, runs).items():
+            results[f"{name}[{size}]"] = round(value, 3)
+
+    baseline = {}
+    if BASELINE_FILE.exists():
+        baseline = json.loads(BASELINE_FILE.read_text())["results"]
+    regressions = compare(results, baseline, tolerance)
+
+    if save:
+        BASELINE_FILE.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "runs": runs,
+                    "results": {**baseline, **results},
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"Saved the baseline to {BASELINE_FILE}")
+    over_budget = [
+        name
+        for name, value in results.items()
+        if name.startswith("checker_import") and value > CHECKER_BUDGET_MS
+    ]
+    for name in over_budget:
+        print(f"{name} is over the budget of {CHECKER_BUDGET_MS} ms")
+    if check and regressions:
+        print(f"{len(regressions)} benchmark(s) slower than {tolerance}x the baseline")
+        return 1
+    if check and over_budget:
+        return 1
+    return 0
+
+
+def parse_args(args: list[str]) -> dict:
+    options: dict = {}
+    while args:
+        option = args.pop(0)
+        if option == "--runs":
+            options["runs"] = int(args.pop(0))
+        elif option == "--sizes":
+            options["sizes"] = tuple(int(size) for size in args.pop(0).split(","))
+        elif option == "--tolerance":
+            options["tolerance"] = float(args.pop(0))
+        elif option in ("--save", "--check"):
+            options[option[2:]] = True
+        else:
+            raise ValueError(f"Unknown option: {option}")
+    return options
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(__doc__)
+        sys.exit(0)
+    sys.exit(main(**parse_args(sys.argv[1:])))
@@ -1,3 +1,11 @@
-from poetry_auto_export.plugin import PoetryAutoExport
+# The plugin pulls in poetry and cleo. `check_requirements_file` runs on every
+# commit and imports none of that, so the plugin is only imported when used.
+def __getattr__(name: str):
+    if name == "PoetryAutoExport":
+        from poetry_auto_export.plugin import PoetryAutoExport
+
+        return PoetryAutoExport
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ["PoetryAutoExport"]
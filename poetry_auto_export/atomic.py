@@ -0,0 +1,34 @@
+"""Replace files atomically, so other processes never see them half written.
+
+Exports, the stat cache, the export cache and the files of the background worker
+are all read by other processes while they may be written.
+"""
+
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from poetry_auto_export import chunks
+
+
+def write(path: Path, *content: str, keep_mode: bool = False):
+    """Replace the contents of `path` with the given pieces of content.
+
+    They are written to a temporary file next to `path`, named after the process
+    and the thread, which is then moved into place. With `keep_mode`, it gets the
+    permissions of the file it replaces. On failure, the temporary file is removed
+    and the error is raised.
+    """
+    temp_file = path.with_name(
+        f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        with open(temp_file, "w", encoding="utf-8") as f:
+            chunks.write(f, *content)
+        if keep_mode and path.exists():
+            shutil.copymode(path, temp_file)
+        os.replace(temp_file, path)
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,158 @@
+"""Export in a detached worker process, so the poetry command returns immediately.
+
+With the `background` setting, a command which changes poetry.lock requests an
+export and hands it to a worker, instead of exporting before it exits. The worker
+keeps its files next to poetry.lock:
+
+- `.poetry-auto-export.lock` is locked by the worker while it runs, so there's only
+  ever one worker per project,
+- `.poetry-auto-export.request` holds the generation of the newest request,
+- `.poetry-auto-export.status` holds the generation the worker exported last, with
+  its exit code and output.
+
+Requests made while the worker runs are left to it: once it's done, it exports
+again from the newest poetry.lock and pyproject.toml, so any number of them are
+coalesced into a single export.
+
+`check_requirements_file.py --wait` reads the same files; keep the format in sync.
+"""
+
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from poetry_auto_export import atomic
+from poetry_auto_export.locks import FileLock
+
+LOCK_FILE = ".poetry-auto-export.lock"
+REQUEST_FILE = ".poetry-auto-export.request"
+STATUS_FILE = ".poetry-auto-export.status"
+POLL_INTERVAL = 0.05
+# The worker releases its lock before it checks for a last request, so a pending
+# request without a worker is only given up on once it stays that way.
+STALE_AFTER = 1.0
+
+
+def start(project: Path, directory: Path):
+    """Request an export of `project`, and start a worker unless one is running.
+
+    `directory` holds the files of the worker. Like the plugin, the worker writes
+    the exports relative to the current working directory.
+    """
+    atomic.write(
+        directory / REQUEST_FILE, str(max(time.time_ns(), requested(directory) + 1))
+    )
+    lock = FileLock(directory / LOCK_FILE)
+    if not lock.acquire(blocking=False):
+        return  # the running worker exports again once it's done
+    try:
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                __name__,
+                str(project),
+                str(directory),
+                str(lock.fd),
+            ],
+            pass_fds=(lock.fd,),  # type: ignore[arg-type]
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    finally:
+        # The worker holds the lock from now on, through the inherited descriptor.
+        lock.release()
+
+
+def requested(directory: Path) -> int:
+    """The generation of the newest request, 0 if there was none."""
+    try:
+        return int((directory / REQUEST_FILE).read_text())
+    except (OSError, ValueError):
+        return 0
+
+
+def read_status(directory: Path) -> dict:
+    """The generation, exit code and output of the last export of the worker."""
+    try:
+        status = json.loads((directory / STATUS_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return status if isinstance(status, dict) else {}
+
+
+def is_pending(directory: Path) -> bool:
+    """Whether an export was requested since the worker's last one started."""
+    return requested(directory) > read_status(directory).get("generation", 0)
+
+
+def run(project: Path, directory: Path, lock: FileLock):
+    """Export `project` until no more requests are pending, then release `lock`."""
+    while True:
+        while is_pending(directory):
+            generation = requested(directory)
+            exit_code, output = _export(project)
+            status = {
+                "generation": generation,
+                "exit_code": exit_code,
+                "output": output,
+            }
+            atomic.write(directory / STATUS_FILE, json.dumps(status))
+        lock.release()
+        # A request made before the lock was released was left to this worker.
+        if not is_pending(directory):
+            return
+        lock.acquire()
+
+
+def wait(directory: Path, timeout: float | None = None) -> dict:
+    """Wait until no export is pending or running, returning the status of the last one.
+
+    Raises TimeoutError after `timeout` seconds, and RuntimeError if an export is
+    pending but no worker is running, e.g. because it was killed.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    stale_since = None
+    while True:
+        lock = FileLock(directory / LOCK_FILE)
+        if not lock.acquire(blocking=False, shared=True):
+            stale_since = None
+        else:
+            lock.release()
+            if not is_pending(directory):
+                return read_status(directory)
+            stale_since = stale_since or time.monotonic()
+            if time.monotonic() - stale_since > STALE_AFTER:
+                raise RuntimeError("The background export isn't running.")
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("The background export didn't finish in time.")
+        time.sleep(POLL_INTERVAL)
+
+
+def _export(project: Path) -> tuple[int, str]:
+    """Export the targets of `project` from its current files, returning the exit code and output."""
+    from cleo.io.buffered_io import BufferedIO
+    from poetry.factory import Factory
+
+    from poetry_auto_export.plugin import PoetryAutoExport
+
+    io = BufferedIO()
+    try:
+        plugin = PoetryAutoExport()
+        plugin.set_poetry(Factory().create_poetry(project, io=io))
+        exit_code = plugin.export_all(io, "auto-export background")
+    # Poetry may fail in any way, and the worker must still record its status
+    # for `poetry auto-export wait`.
+    except Exception as error:  # noqa: BLE001
+        io.write_error_line(f"Failed to export {project}: {error}")
+        exit_code = 1
+    return exit_code, io.fetch_output() + io.fetch_error()
+
+
+if __name__ == "__main__":
+    project, directory, fd = sys.argv[1:]
+    run(Path(project), Path(directory), FileLock(Path(directory) / LOCK_FILE, int(fd)))
@@ -0,0 +1,76 @@
+"""A content-addressed cache of exported files, shared between projects and branches.
+
+Exports are keyed by everything that determines their contents: the lock hash,
+the export options and the version of poetry-plugin-export. Checking out another
+branch with the same poetry.lock, or restoring the cache on a CI runner, then
+turns an export into a copy.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from poetry_auto_export import atomic
+
+DEFAULT_CACHE_SIZE_MB = 100
+
+
+class ExportCache:
+    """Exported files stored by key, with the least recently used evicted first.
+
+    Entries are written atomically, so several processes can share a cache.
+    The modification time of an entry is updated on every hit, to track use.
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(**parts: str | None) -> str:
+        """Hash the parts which determine the contents of an export into a key."""
+        serialized = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """The export stored under `key`, whole like a rendered one, or None."""
+        path = self._path(key)
+        try:
+            content = path.read_text(encoding="utf-8")
+            os.utime(path)
+        except (OSError, UnicodeDecodeError):
+            return None
+        return content
+
+    def put(self, key: str, *content: str):
+        """Store an export, given in pieces like a header and a body."""
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic.write(path, *content)
+        except OSError:
+            # The cache is only an optimization, a failure to fill it is not an error.
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits its size."""
+        entries = []
+        for path in self.directory.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
@@ -1,45 +1,813 @@
 """
 This is a standalone script that checks if a requirements file is up-to-date with the poetry.lock file.
-It computes a SHA1 hash of `poetry.lock` and compares that with a comment in the first line of `requirements.txt`.
+It computes a hash of `poetry.lock` and compares that with a comment in the first line of `requirements.txt`.
+The hash algorithm (SHA1 by default) is read from that comment.
+
+The second line carries a hash of the export options of the file. When the `pyproject.toml`
+next to `poetry.lock` configures the file, the script also checks that its options haven't
+changed since it was exported (this needs Python 3.11+ or `tomli`).
+
+Exports with `fingerprint = "content"` carry a hash of the exported dependencies instead.
+For those, the script checks that the file wasn't edited by hand, and that every pinned
+package version and hash in it is still present in `poetry.lock`.
 
 Usage:
 ```
 python check_requirements_file.py
+# or, with the package installed:
+poetry-auto-export-check
 # for custom file paths:
 python check_requirements_file.py path/to/poetry.lock path/to/requirements.txt
+# to check many requirements files at once, e.g. in a monorepo:
+python check_requirements_file.py --glob "**/requirements*.txt"
+python check_requirements_file.py --manifest pairs.txt
+python check_requirements_file.py --discover path/to/monorepo
+# to wait for the plugin's background export to finish first:
+python check_requirements_file.py --wait
 ```
+
+In batch mode, the options can be repeated and combined. `--glob` pairs each matching file
+with the nearest `poetry.lock` in its directory or a parent. A manifest lists one
+`path/to/poetry.lock path/to/requirements.txt` pair per line. `--discover` finds every
+`[tool.poetry-auto-export]` output in the `pyproject.toml` files under a directory
+(this needs Python 3.11+ or `tomli`). All out of date files are reported at once.
+
+If the plugin's `stat_cache` setting keeps `.poetry-auto-export.json` next to `poetry.lock`,
+the hash of `poetry.lock` and the export options of `pyproject.toml` are taken from it while
+the size, modification time and inode of those files are unchanged, and requirements files
+the plugin recorded as up to date aren't read.
+
+With `--wait`, if the plugin's `background` setting exports in a worker process, the script
+waits for that worker to finish before checking the files.
+
+The exit code is 0 if every file is up to date, 1 if any is out of date or missing,
+and 2 for invalid arguments.
 """
 
-import hashlib
+# This runs on every commit, where starting the interpreter is most of the time
+# it takes, so anything beyond `os` and `sys` is only imported where it's needed.
+import os
 import sys
-from pathlib import Path
 
-if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
-    print(__doc__)
-    sys.exit(0)
+HASH_ALGORITHMS = ("sha1", "sha256", "sha384", "sha512", "blake2b", "blake2s")
+HASH_CHUNK_SIZE = 1 << 16
+OUTDATED_MESSAGE = (
+    "requirements.txt is out of date, use the `poetry-auto-export` plugin to update it!"
+)
+
+# Kept by the plugin's `stat_cache` setting, see `poetry_auto_export/state.py`.
+STATE_FILE = ".poetry-auto-export.json"
+RACY_NS = 2_000_000_000
+
+# The export options and their defaults, see `poetry_auto_export/config.py`.
+EXPORT_OPTIONS = {
+    "format": None,
+    "without_hashes": False,
+    "with_credentials": False,
+    "without_urls": False,
+    "all_extras": False,
+    "only_root": False,
+    "with": [],
+    "without": [],
+    "only": [],
+    "extras": [],
+    "fingerprint": "lock",
+    "incremental": False,
+    "split": None,
+    "shards": 1,
+}
+SPLITS = {"native": ("native", "pure")}
+
+# Kept by the plugin's `background` setting, see `poetry_auto_export/background.py`.
+LOCK_FILE = ".poetry-auto-export.lock"
+REQUEST_FILE = ".poetry-auto-export.request"
+STATUS_FILE = ".poetry-auto-export.status"
+WAIT_TIMEOUT = 600
+WAIT_INTERVAL = 0.05
+STALE_AFTER = 1.0
+
+BATCH_OPTIONS = ("--glob", "--manifest", "--discover")
+SKIP_DIRS = ("node_modules", "__pycache__", "venv", "site-packages")
+
+# e.g. `requests[socks]==2.32.3 ; python_version >= "3.10"`
+REQUIREMENT_PATTERN = r"([A-Za-z0-9][A-Za-z0-9._-]*)(?:\[[^\]]*\])?==([^\s;\\]+)"
+
+EXIT_UP_TO_DATE = 0
+EXIT_OUT_OF_DATE = 1
+EXIT_USAGE = 2
+
+
+class UsageError(Exception):
+    """Invalid arguments, reported with exit code 2."""
+
 
-if len(sys.argv) > 3:
-    print(__doc__)
-    raise ValueError("Too many arguments")
+def file_digest(path: str, algorithm: str) -> str:
+    """Hash a file in chunks, without reading all of it into memory."""
+    import hashlib
 
-lock_file_path = sys.argv[1] if len(sys.argv) > 1 else "poetry.lock"
-requirements_file_path = sys.argv[2] if len(sys.argv) > 2 else "requirements.txt"
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, algorithm).hexdigest()
+        digest = hashlib.new(algorithm)
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        return digest.hexdigest()
 
-lock_file = Path(lock_file_path)
-requirements_file = Path(requirements_file_path)
 
-if not lock_file.is_file():
-    raise FileNotFoundError(f"File not found: {lock_file}")
-elif not lock_file.suffix == ".lock":
-    raise ValueError(f"Invalid file type: {lock_file} (expected .lock file)")
+def file_stat(path: str) -> list[int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
 
-if not requirements_file.is_file():
-    raise FileNotFoundError(f"File not found: {requirements_file}")
 
-lock_hash = hashlib.sha1(lock_file.read_bytes()).hexdigest()
-first_line = requirements_file.read_text().split("\n")[0]
+def load_state(lock_file: str) -> dict | None:
+    """Load the stat cache next to `lock_file`, if there is one."""
+    state_file = os.path.join(os.path.dirname(lock_file), STATE_FILE)
+    if not os.path.isfile(state_file):
+        return None
+    import json
 
-if first_line != f"# poetry.lock hash: {lock_hash}":
-    raise ValueError(
-        "requirements.txt is out of date, use the `poetry-auto-export` plugin to update it!"
+    try:
+        with open(state_file, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or not isinstance(state.get("files"), dict):
+        return None
+    return state
+
+
+def trusted_entry(state: dict, path: str) -> dict:
+    """The recorded state of a file, or an empty one if it changed since."""
+    entry = state["files"].get(os.path.abspath(path))
+    if not isinstance(entry, dict) or entry.get("stat") != file_stat(path):
+        return {}
+    if entry["stat"][1] + RACY_NS >= entry.get("recorded_at", 0):
+        return {}
+    return entry
+
+
+def record_entry(state: dict, path: str, stat: list[int], **values):
+    """Record the state of a file, taken as `stat` before it was read."""
+    import time
+
+    state["files"][os.path.abspath(path)] = {
+        "stat": stat,
+        "recorded_at": time.time_ns(),
+        **values,
+    }
+
+
+def is_recorded_up_to_date(state: dict, lock_file: str, requirements_file: str) -> bool:
+    """Whether both files are unchanged since the plugin found them up to date, with
+    the current export options."""
+    hashes = trusted_entry(state, lock_file).get("hashes", {})
+    entry = trusted_entry(state, requirements_file)
+    for algorithm, digest in hashes.items():
+        if entry.get("lock_hash") == digest:
+            return options_match(
+                lock_file,
+                requirements_file,
+                algorithm,
+                entry.get("options_hash"),
+                state,
+            )
+    return False
+
+
+def lock_digest(lock_file: str, algorithm: str, state: dict | None = None) -> str:
+    """Hash `lock_file`, unless the stat cache has its hash, and record it there."""
+    if state is None:
+        return file_digest(lock_file, algorithm)
+    hashes = trusted_entry(state, lock_file).get("hashes", {})
+    if digest := hashes.get(algorithm):
+        return digest
+    stat = file_stat(lock_file)
+    digest = file_digest(lock_file, algorithm)
+    if stat:
+        record_entry(state, lock_file, stat, hashes={**hashes, algorithm: digest})
+        save_state(os.path.dirname(lock_file), state)
+    return digest
+
+
+def save_state(directory: str, state: dict):
+    import json
+    import threading
+
+    state_file = os.path.join(directory, STATE_FILE)
+    # The lock files are hashed concurrently, see `check_many`.
+    temp_file = os.path.join(
+        directory, f".{STATE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
     )
+    try:
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.replace(temp_file, state_file)
+    except OSError:
+        if os.path.exists(temp_file):
+            os.unlink(temp_file)
+
+
+def is_export_running(directory: str) -> bool:
+    """Whether the plugin's background worker holds its lock in `directory`."""
+    try:
+        import fcntl
+    except ImportError:  # Windows, where the plugin doesn't export in the background
+        return False
+    try:
+        fd = os.open(os.path.join(directory, LOCK_FILE), os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def is_export_pending(directory: str) -> bool:
+    """Whether an export was requested since the background worker's last one started."""
+    import json
+
+    try:
+        with open(os.path.join(directory, REQUEST_FILE), encoding="utf-8") as f:
+            requested = int(f.read())
+    except (OSError, ValueError):
+        return False
+    try:
+        with open(os.path.join(directory, STATUS_FILE), encoding="utf-8") as f:
+            generation = json.load(f).get("generation", 0)
+    except (OSError, ValueError, AttributeError):
+        generation = 0
+    return requested > generation
+
+
+def wait_for_export(directory: str):
+    """Wait until the plugin's background export in `directory` is done, if there's one.
+
+    An export which stays pending without a worker, e.g. because it was killed,
+    isn't waited for: the files are checked as they are.
+    """
+    import time
+
+    started = time.monotonic()
+    stale_since = None
+    while time.monotonic() - started < WAIT_TIMEOUT:
+        if is_export_running(directory):
+            stale_since = None
+        elif not is_export_pending(directory):
+            return
+        else:
+            stale_since = stale_since or time.monotonic()
+            if time.monotonic() - stale_since > STALE_AFTER:
+                return
+        time.sleep(WAIT_INTERVAL)
+
+
+def canonicalize_name(name: str) -> str:
+    import re
+
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def locked_packages(lock_file: str) -> dict[tuple[str, str], set[str]]:
+    """Map the name and version of each locked package to the hashes of its files."""
+    import re
+
+    with open(lock_file, encoding="utf-8") as f:
+        blocks = f.read().split("[[package]]\n")[1:]
+    packages = {}
+    for block in blocks:
+        name = re.search(r'^name = "([^"]+)"', block, re.MULTILINE)
+        version = re.search(r'^version = "([^"]+)"', block, re.MULTILINE)
+        if name and version:
+            key = (canonicalize_name(name.group(1)), version.group(1))
+            packages[key] = set(re.findall(r'hash = "([^"]+)"}', block))
+    return packages
+
+
+def read_header(requirements_file: str) -> tuple[str, str, str, str | None]:
+    """Read the fingerprint kind, hash algorithm, hash and options hash from the header.
+
+    The header is `# poetry.lock hash: <sha1>`, `# poetry.lock <algorithm>: <hash>`
+    or, for content fingerprints, `# export content <hash|algorithm>: <hash>`. It's
+    followed by `# export options <hash|algorithm>: <hash>`, with the same label.
+    Only these two lines are read.
+    """
+    with open(requirements_file, encoding="utf-8") as f:
+        first_line = f.readline().rstrip("\n")
+        second_line = f.readline().rstrip("\n")
+    for kind in ("poetry.lock", "export content"):
+        prefix = f"# {kind} "
+        label, separator, digest = first_line.removeprefix(prefix).partition(": ")
+        if first_line.startswith(prefix) and separator:
+            if label not in ("hash", *HASH_ALGORITHMS):
+                continue
+            options_prefix = f"# export options {label}: "
+            options_hash = None
+            if second_line.startswith(options_prefix):
+                options_hash = second_line.removeprefix(options_prefix)
+            algorithm = "sha1" if label == "hash" else label
+            return kind, algorithm, digest, options_hash
+    return "poetry.lock", "sha1", "", None
+
+
+def load_toml():
+    """The TOML parser of the standard library, or `tomli` before Python 3.11."""
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            return None
+    return tomllib
+
+
+# The export sections of each pyproject.toml, by its absolute path.
+_export_sections: dict[str, list[dict]] = {}
+
+
+def export_sections(project: str, state: dict | None = None) -> list[dict]:
+    """The export sections of `[tool.poetry-auto-export]` in a project's pyproject.toml.
+
+    Only the output and the options of each section are kept. With the stat cache,
+    they are recorded there, and pyproject.toml is only parsed again once it changes.
+    """
+    pyproject = os.path.join(project, "pyproject.toml")
+    key = os.path.abspath(pyproject)
+    if key in _export_sections:
+        return _export_sections[key]
+    sections = None
+    if state is not None:
+        sections = trusted_entry(state, pyproject).get("export_sections")
+    if not isinstance(sections, list):
+        stat = file_stat(pyproject)
+        sections = parse_export_sections(pyproject)
+        if sections is None:
+            sections = []
+        elif state is not None and stat:
+            record_entry(state, pyproject, stat, export_sections=sections)
+            save_state(project, state)
+    _export_sections[key] = sections
+    return sections
+
+
+def parse_export_sections(pyproject: str) -> list[dict] | None:
+    """Parse the export sections of a pyproject.toml, or None without a TOML parser."""
+    sections = read_export_sections(pyproject)
+    if sections is not None:
+        return sections
+    tomllib = load_toml()
+    if tomllib is None:
+        return None
+    try:
+        with open(pyproject, "rb") as f:
+            config = tomllib.load(f).get("tool", {}).get("poetry-auto-export")
+    except (OSError, ValueError):
+        return []
+    if not isinstance(config, dict):
+        return []
+    exports = config.get("exports", [])
+    return _export_sections_of(
+        [config, *(exports if isinstance(exports, list) else [])]
+    )
+
+
+def read_export_sections(pyproject: str) -> list[dict] | None:
+    """Read the export sections of a pyproject.toml line by line, without tomllib.
+
+    Importing tomllib takes longer than all of the checks, so the usual layout is
+    read directly: `[tool.poetry-auto-export]` and `[[tool.poetry-auto-export.exports]]`
+    tables of strings, booleans, integers and arrays of strings. Returns None for
+    anything else, to be parsed by tomllib.
+    """
+    try:
+        with open(pyproject, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return []
+    config: dict = {}
+    exports: list[dict] = []
+    table = None
+    key = value = ""
+    for line in lines:
+        line = _strip_comment(line).strip()
+        if value:  # the rest of a multi-line array
+            value += " " + line
+        elif not line:
+            continue
+        elif line.startswith("["):
+            if line == "[tool.poetry-auto-export]":
+                table = config
+            elif line == "[[tool.poetry-auto-export.exports]]":
+                table = {}
+                exports.append(table)
+            elif "poetry-auto-export" in line:
+                return None
+            else:
+                table = None
+            continue
+        elif "poetry-auto-export" in line:  # e.g. dotted keys in another table
+            return None
+        elif table is None:
+            continue
+        else:
+            key, separator, value = (part.strip() for part in line.partition("="))
+            if not separator or not key.replace("_", "").replace("-", "").isalnum():
+                return None
+        if value.count("[") > value.count("]"):
+            continue
+        try:
+            table[key] = _parse_value(value)  # type: ignore[index]
+        except ValueError:
+            return None
+        value = ""
+    if value:
+        return None
+    return _export_sections_of([config, *exports])
+
+
+def _strip_comment(line: str) -> str:
+    quote = None
+    for index, char in enumerate(line):
+        if quote:
+            quote = None if char == quote else quote
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "#":
+            return line[:index]
+    return line
+
+
+def _parse_value(text: str):
+    """Parse a TOML string, boolean, integer or array of strings, or raise ValueError."""
+    if text in ("true", "false"):
+        return text == "true"
+    if text[:1] in ("'", '"'):
+        if len(text) < 2 or text[-1] != text[0] or text[0] in text[1:-1]:
+            raise ValueError(text)
+        if "\\" in text and text[0] == '"':  # escape sequences
+            raise ValueError(text)
+        return text[1:-1]
+    if text.startswith("[") and text.endswith("]"):
+        items = [item.strip() for item in text[1:-1].split(",")]
+        if items and not items[-1]:  # a trailing comma
+            items.pop()
+        values = [_parse_value(item) for item in items]
+        if not all(isinstance(value, str) for value in values):
+            raise ValueError(text)
+        return values
+    if text.isdigit():
+        return int(text)
+    raise ValueError(text)
+
+
+def _export_sections_of(sections: list) -> list[dict]:
+    """Keep the output and the options of each export section with an output."""
+    return [
+        {
+            key: value
+            for key, value in section.items()
+            if key == "output" or key in EXPORT_OPTIONS
+        }
+        for section in sections
+        if isinstance(section, dict) and isinstance(section.get("output"), str)
+    ]
+
+
+def section_outputs(section: dict) -> list[tuple[str, str | None]]:
+    """The files an export section is written to, with the part written to each."""
+    split, shards = section.get("split"), section.get("shards", 1)
+    if split in SPLITS:
+        names = SPLITS[split]
+    elif isinstance(shards, int) and shards > 1:
+        names = tuple(str(shard) for shard in range(1, shards + 1))
+    else:
+        return [(section["output"], None)]
+    directory, file_name = os.path.split(section["output"])
+    stem, suffix = os.path.splitext(file_name)
+    return [(os.path.join(directory, f"{stem}-{name}{suffix}"), name) for name in names]
+
+
+def expected_options_hash(
+    lock_file: str, requirements_file: str, algorithm: str, state: dict | None = None
+) -> str | None:
+    """Hash the export options of `requirements_file` the same way the plugin does.
+
+    Returns None if the pyproject.toml next to `lock_file` doesn't configure it.
+    """
+    project = os.path.dirname(lock_file)
+    for section in export_sections(project, state):
+        for output, part in section_outputs(section):
+            if os.path.abspath(os.path.join(project, output)) != os.path.abspath(
+                requirements_file
+            ):
+                continue
+            import hashlib
+
+            options = {}
+            for key, default in EXPORT_OPTIONS.items():
+                value = section.get(key, default)
+                if value != default:
+                    options[key] = sorted(value) if isinstance(value, list) else value
+            if part:
+                options["part"] = part
+            return hashlib.new(algorithm, dump_json(options).encode()).hexdigest()
+    return None
+
+
+def dump_json(value) -> str:
+    """Serialize like `json.dumps(value, sort_keys=True, separators=(",", ":"))`.
+
+    Export options are short and simple, and importing json takes longer than
+    serializing them here. Other values are left to json.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if (
+        isinstance(value, str)
+        and value.isascii()
+        and value.isprintable()
+        and '"' not in value
+        and "\\" not in value
+    ):
+        return f'"{value}"'
+    if isinstance(value, list):
+        return "[" + ",".join(dump_json(item) for item in value) + "]"
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return (
+            "{"
+            + ",".join(
+                f"{dump_json(k)}:{dump_json(v)}" for k, v in sorted(value.items())
+            )
+            + "}"
+        )
+    import json
+
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def options_match(
+    lock_file: str,
+    requirements_file: str,
+    algorithm: str,
+    options_hash: str | None,
+    state: dict | None = None,
+) -> bool:
+    """Whether the options hash of a file matches its configuration, if it has one."""
+    expected = expected_options_hash(lock_file, requirements_file, algorithm, state)
+    return expected is None or expected == options_hash
+
+
+def check_content(
+    lock_file: str, requirements_file: str, algorithm: str, expected_hash: str
+):
+    """Check a requirements file exported with a content fingerprint."""
+    import hashlib
+    import re
+
+    with open(requirements_file, encoding="utf-8") as f:
+        body = f.read()
+    while body.startswith("#"):  # the header
+        body = body.partition("\n")[2]
+    if hashlib.new(algorithm, body.encode()).hexdigest() != expected_hash:
+        raise ValueError(f"{OUTDATED_MESSAGE} (it was modified after the export)")
+
+    packages = locked_packages(lock_file)
+    for line in body.replace("\\\n", " ").split("\n"):
+        if not (match := re.match(REQUIREMENT_PATTERN, line)):
+            continue
+        name, version = canonicalize_name(match.group(1)), match.group(2)
+        if (name, version) not in packages:
+            raise ValueError(f"{OUTDATED_MESSAGE} ({name}=={version} is not locked)")
+        if not set(re.findall(r"--hash=(\S+)", line)) <= packages[(name, version)]:
+            raise ValueError(f"{OUTDATED_MESSAGE} (hashes of {name} have changed)")
+
+
+def validate_files(lock_file: str, requirements_file: str):
+    if not os.path.isfile(lock_file):
+        raise FileNotFoundError(f"File not found: {lock_file}")
+    elif not os.path.basename(lock_file).endswith(".lock"):
+        raise ValueError(f"Invalid file type: {lock_file} (expected .lock file)")
+
+    if not os.path.isfile(requirements_file):
+        raise FileNotFoundError(f"File not found: {requirements_file}")
+
+
+def check(lock_file: str, requirements_file: str):
+    """Raise an error if `requirements_file` is out of date with `lock_file`."""
+    validate_files(lock_file, requirements_file)
+    state = load_state(lock_file)
+    if state and is_recorded_up_to_date(state, lock_file, requirements_file):
+        return
+    kind, algorithm, header_hash, options_hash = read_header(requirements_file)
+    if kind == "export content":
+        check_content(lock_file, requirements_file, algorithm, header_hash)
+    elif lock_digest(lock_file, algorithm, state) != header_hash:
+        raise ValueError(OUTDATED_MESSAGE)
+    if not options_match(lock_file, requirements_file, algorithm, options_hash, state):
+        raise ValueError(f"{OUTDATED_MESSAGE} (its export options have changed)")
+
+
+def find_lock_file(requirements_file: str) -> str:
+    """Find the poetry.lock next to a requirements file, or in a parent directory."""
+    directory = os.path.dirname(os.path.abspath(requirements_file))
+    while True:
+        if os.path.isfile(os.path.join(directory, "poetry.lock")):
+            return os.path.join(directory, "poetry.lock")
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return os.path.join(os.path.dirname(requirements_file), "poetry.lock")
+
+
+def pairs_from_glob(pattern: str) -> list[tuple[str, str]]:
+    import glob
+
+    return [
+        (find_lock_file(path), os.path.normpath(path))
+        for path in sorted(glob.glob(pattern, recursive=True))
+    ]
+
+
+def pairs_from_manifest(manifest: str) -> list[tuple[str, str]]:
+    """Read `path/to/poetry.lock path/to/requirements.txt` lines from a manifest file.
+
+    Relative paths are resolved against the directory of the manifest.
+    """
+    base = os.path.dirname(manifest)
+    with open(manifest, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    pairs = []
+    for line in lines:
+        if line.strip() and not line.lstrip().startswith("#"):
+            lock_path, requirements_path = line.split()
+            pairs.append(
+                (
+                    os.path.normpath(os.path.join(base, lock_path)),
+                    os.path.normpath(os.path.join(base, requirements_path)),
+                )
+            )
+    return pairs
+
+
+def pairs_from_pyprojects(root: str) -> list[tuple[str, str]]:
+    """Find the outputs of every `[tool.poetry-auto-export]` in a tree of projects.
+
+    tomllib is only needed for the pyproject.toml files `read_export_sections`
+    can't read.
+    """
+    pairs = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(
+            d for d in subdirectories if not d.startswith(".") and d not in SKIP_DIRS
+        )
+        if "pyproject.toml" not in files:
+            continue
+        pyproject = os.path.abspath(os.path.join(directory, "pyproject.toml"))
+        if pyproject not in _export_sections:
+            sections = parse_export_sections(pyproject)
+            if sections is None:
+                raise UsageError(
+                    f"--discover requires Python 3.11+ or tomli to read {pyproject}"
+                )
+            _export_sections[pyproject] = sections
+        for section in export_sections(directory):
+            for output, _ in section_outputs(section):
+                pairs.append(
+                    (
+                        os.path.normpath(os.path.join(directory, "poetry.lock")),
+                        os.path.normpath(os.path.join(directory, output)),
+                    )
+                )
+    return pairs
+
+
+def check_many(pairs: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """Check many requirements files at once, returning the problems found.
+
+    Only the header of each requirements file is read, and the pyproject.toml of
+    each project is parsed once. Every lock file is hashed once per algorithm,
+    with the lock files hashed concurrently.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def header(pair: tuple[str, str]) -> tuple[str, str, str, str | None]:
+        validate_files(*pair)
+        return read_header(pair[1])
+
+    def digest(key: tuple[str, str]) -> str:
+        lock_file, algorithm = key
+        return lock_digest(lock_file, algorithm, load_state(lock_file))
+
+    with ThreadPoolExecutor() as pool:
+        headers = list(pool.map(lambda pair: capture(header, pair), pairs))
+        to_hash = {
+            (lock_file, result[1])
+            for (lock_file, _), result in zip(pairs, headers)
+            if isinstance(result, tuple) and result[0] == "poetry.lock"
+        }
+        digests = dict(zip(to_hash, pool.map(digest, to_hash)))
+
+        def compare(pair, result) -> Exception | None:
+            if isinstance(result, Exception):
+                return result
+            kind, algorithm, header_hash, options_hash = result
+            if kind == "export content":
+                error = capture(check_content, pair[0], pair[1], algorithm, header_hash)
+                if error:
+                    return error
+            elif digests[(pair[0], algorithm)] != header_hash:
+                return ValueError("out of date with poetry.lock")
+            if not options_match(pair[0], pair[1], algorithm, options_hash):
+                return ValueError("out of date with its export options")
+            return None
+
+        errors = list(pool.map(compare, pairs, headers))
+
+    return [(pair[1], str(error)) for pair, error in zip(pairs, errors) if error]
+
+
+def capture(function, *args):
+    """Call `function`, returning the exception it raises instead of raising it."""
+    try:
+        return function(*args)
+    except (OSError, ValueError) as error:
+        return error
+
+
+def run_batch(args: list[str], wait: bool = False) -> int:
+    """Check the requirements files selected by the batch options, report all problems."""
+    if len(args) % 2:
+        raise UsageError(f"Missing value for {args[-1]}")
+    pairs = []
+    for option, value in zip(args[::2], args[1::2]):
+        if option == "--glob":
+            pairs.extend(pairs_from_glob(value))
+        elif option == "--manifest":
+            pairs.extend(pairs_from_manifest(value))
+        elif option == "--discover":
+            pairs.extend(pairs_from_pyprojects(value))
+        else:
+            raise UsageError(f"Unknown option: {option}")
+
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        print("No requirements files found to check.", file=sys.stderr)
+        return EXIT_OUT_OF_DATE
+    if wait:
+        for directory in dict.fromkeys(os.path.dirname(lock) for lock, _ in pairs):
+            wait_for_export(directory or ".")
+    problems = check_many(pairs)
+    for requirements_file, problem in problems:
+        print(f"{requirements_file}: {problem}", file=sys.stderr)
+    if problems:
+        print(
+            f"{len(problems)} requirements file(s) out of date, "
+            "use the `poetry-auto-export` plugin to update them!",
+            file=sys.stderr,
+        )
+        return EXIT_OUT_OF_DATE
+    print(f"{len(pairs)} requirements file(s) up to date.")
+    return EXIT_UP_TO_DATE
+
+
+def main(args: list[str] | None = None) -> int:
+    """Check the requirements files given by `args`, returning the exit code."""
+    args = sys.argv[1:] if args is None else args
+    if args[:1] in (["-h"], ["--help"]):
+        print(__doc__)
+        return EXIT_UP_TO_DATE
+    wait = "--wait" in args
+    args = [arg for arg in args if arg != "--wait"]
+    try:
+        if args[:1] and args[0] in BATCH_OPTIONS:
+            return run_batch(args, wait)
+        if len(args) > 2:
+            raise UsageError("Too many arguments")
+        if unknown := [arg for arg in args if arg.startswith("-")]:
+            raise UsageError(f"Unknown option: {unknown[0]}")
+        lock_file = args[0] if args else "poetry.lock"
+        requirements_file = args[1] if len(args) > 1 else "requirements.txt"
+        if wait:
+            wait_for_export(os.path.dirname(lock_file) or ".")
+        check(lock_file, requirements_file)
+    except UsageError as error:
+        print(f"{error}, see --help for usage.", file=sys.stderr)
+        return EXIT_USAGE
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return EXIT_OUT_OF_DATE
+    return EXIT_UP_TO_DATE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""Handle large exports a chunk at a time, so they aren't copied whole.
+
+Exports with hashes of large lock files take megabytes. They are compared,
+written and hashed in chunks of `CHUNK_SIZE` characters, instead of being encoded
+into bytes all at once.
+"""
+
+from collections.abc import Iterator
+from typing import TextIO
+
+CHUNK_SIZE = 1 << 16
+
+
+def chunks(text: str) -> Iterator[str]:
+    """Slice `text` into chunks of `CHUNK_SIZE` characters."""
+    for start in range(0, len(text), CHUNK_SIZE):
+        yield text[start : start + CHUNK_SIZE]
+
+
+def write(f: TextIO, *content: str):
+    """Write the given pieces of content to a text file, a chunk at a time."""
+    for piece in content:
+        f.writelines(chunks(piece))
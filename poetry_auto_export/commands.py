@@ -0,0 +1,329 @@
+"""The `poetry auto-export` commands.
+
+They are only imported when one of them runs, see `PoetryAutoExport.activate`.
+"""
+
+import dataclasses
+import os
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from cleo.helpers import argument, option
+from poetry.console.commands.command import Command
+
+from poetry_auto_export.state import file_stat
+
+if TYPE_CHECKING:
+    from poetry_auto_export.plugin import PoetryAutoExport
+
+SKIP_DIRS = ("node_modules", "__pycache__", "venv", "site-packages")
+
+
+class AutoExportCommand(Command):
+    name = "auto-export"
+    description = "Export the requirements files configured in pyproject.toml."
+    options = [
+        option(
+            "check",
+            None,
+            "Check that the exported files are up to date, without writing them.",
+        ),
+        option(
+            "diff",
+            None,
+            "Like --check, and print the differences of the files which aren't.",
+        ),
+    ]
+    help = """\
+The <info>auto-export</info> command exports the targets configured in <comment>pyproject.toml</>,
+skipping those which are up to date.
+
+With <comment>--check</> or <comment>--diff</>, the targets are rendered in memory and compared with
+the files in full, and the command fails if any of them is out of date. Nothing is written.
+"""
+
+    def __init__(self, plugin: "PoetryAutoExport"):
+        super().__init__()
+        self.plugin = plugin
+
+    def handle(self) -> int:
+        try:
+            if self.option("check") or self.option("diff"):
+                return self.plugin.check_all(self.io, diff=self.option("diff"))
+            return self.plugin.export_all(self.io, self.name)
+        except ValueError as error:
+            self.line_error(f"<error>{error}</>")
+            return 1
+
+
+class WatchCommand(Command):
+    name = "auto-export watch"
+    description = "Keep the exported requirements files in sync with poetry.lock and pyproject.toml."
+    options = [
+        option(
+            "interval",
+            None,
+            "Seconds between checks of the watched files.",
+            flag=False,
+            default="0.5",
+        ),
+        option(
+            "debounce",
+            None,
+            "Seconds without further changes to wait for before exporting.",
+            flag=False,
+            default="0.2",
+        ),
+    ]
+    help = """\
+The <info>auto-export watch</info> command exports the configured targets, then
+exports them again whenever <comment>poetry.lock</> or <comment>pyproject.toml</> change,
+e.g. after a git pull or a merge. Stop it with Ctrl+C.
+"""
+
+    def __init__(self, plugin: "PoetryAutoExport"):
+        super().__init__()
+        self.plugin = plugin
+
+    def handle(self) -> int:
+        try:
+            interval = float(self.option("interval"))
+            debounce = float(self.option("debounce"))
+        except ValueError:
+            self.line_error("<error>--interval and --debounce must be numbers.</>")
+            return 1
+
+        poetry = self.poetry
+        lock_file, pyproject_file = poetry.locker.lock, poetry.pyproject_path
+        self.line(
+            f"Watching <comment>{lock_file.name}</> and <comment>{pyproject_file.name}</>"
+        )
+        previous_lock = self._export()
+        try:
+            for changed in watch([lock_file, pyproject_file], interval, debounce):
+                previous_lock = self._export(
+                    reload_pyproject=pyproject_file in changed,
+                    previous_lock=previous_lock,
+                )
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    def _export(
+        self, reload_pyproject: bool = False, previous_lock: bytes | None = None
+    ) -> bytes | None:
+        """Export the targets, returning the poetry.lock they were exported from.
+
+        Errors are reported and the watcher keeps going, so that the next edit of
+        the watched files, e.g. one fixing an invalid pyproject.toml, is exported.
+        """
+        try:
+            if reload_pyproject:
+                # The configuration is parsed again from the new pyproject.toml
+                self.reset_poetry()
+                self.plugin.reset()
+            else:
+                # Only the lock data is loaded again, the rest of poetry stays warm
+                self.poetry.locker._lock_data = None
+            self.plugin._previous_lock = previous_lock
+            configs = self.plugin.configs
+            lock = None
+            if any(export.incremental for export in configs):
+                lock = self.poetry.locker.lock.read_bytes()
+            self.plugin.export_all(self.io, self.name)
+        # Poetry may fail in any way on an invalid pyproject.toml, which mustn't stop
+        # the watcher.
+        except Exception as error:  # noqa: BLE001
+            self.line_error(f"<error>Failed to export:</> {error}")
+            return None
+        return lock
+
+
+def watch(paths: list[Path], interval: float, debounce: float) -> Iterator[set[Path]]:
+    """Yield the paths which changed, once changes have settled for `debounce` seconds.
+
+    Poetry writes poetry.lock and pyproject.toml in one go, and a checkout writes
+    both at once, so a burst of changes is reported as a single one. The files are
+    polled by their stat metadata, which is cheap for a handful of files.
+    """
+    stats = {path: file_stat(path) for path in paths}
+    while True:
+        time.sleep(interval)
+        changed = {path for path in paths if file_stat(path) != stats[path]}
+        if not changed:
+            continue
+        while True:
+            stats.update({path: file_stat(path) for path in changed})
+            time.sleep(debounce)
+            more = {path for path in paths if file_stat(path) != stats[path]}
+            if not more:
+                break
+            changed |= more
+        yield changed
+
+
+class AllCommand(Command):
+    name = "auto-export all"
+    description = (
+        "Export the requirements files of every Poetry project under a directory."
+    )
+    arguments = [
+        argument(
+            "root", "The directory to search for projects.", optional=True, default="."
+        )
+    ]
+    options = [
+        option(
+            "jobs",
+            "j",
+            "Number of projects to export concurrently.",
+            flag=False,
+            default="1",
+        ),
+    ]
+    help = """\
+The <info>auto-export all</info> command finds every <comment>pyproject.toml</> with a
+<comment>[tool.poetry-auto-export]</> section and a <comment>poetry.lock</> under the given directory,
+and exports their targets in a single process. Targets which are up to date are skipped.
+With <comment>--jobs</>, that many projects are exported concurrently, each exporting its targets
+one at a time, whatever its <comment>jobs</> setting.
+"""
+
+    def __init__(self, plugin: "PoetryAutoExport"):
+        super().__init__()
+        self.plugin = plugin
+
+    def handle(self) -> int:
+        try:
+            jobs = int(self.option("jobs"))
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            self.line_error("<error>--jobs must be a positive integer.</>")
+            return 1
+
+        projects = find_projects(Path(self.argument("root")))
+        if not projects:
+            self.line_error("No projects to export found.")
+            return 1
+
+        if jobs > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(self._export_project, projects))
+        else:
+            results = list(map(self._export_project, projects))
+
+        # Each project's output is buffered, so it's printed in order and in one piece.
+        exit_code = 0
+        for project, (project_exit_code, output, errors) in zip(projects, results):
+            self.line(f"<info>{project}</>")
+            self.io.write(output)
+            self.io.write_error(errors)
+            exit_code = max(exit_code, project_exit_code)
+        return exit_code
+
+    def _export_project(self, project: Path) -> tuple[int, str, str]:
+        """Export the targets of a single project, returning its exit code and output."""
+        from cleo.io.buffered_io import BufferedIO
+        from poetry.factory import Factory
+
+        from poetry_auto_export.plugin import PoetryAutoExport
+
+        io = BufferedIO(decorated=self.io.output.is_decorated())
+        io.set_verbosity(self.io.output.verbosity)
+        try:
+            plugin = PoetryAutoExport()
+            plugin.set_poetry(Factory().create_poetry(project, io=io))
+            # Outputs are relative to the project, not to the working directory.
+            plugin.configs = [
+                dataclasses.replace(export, output=str(project / export.output))
+                for export in plugin.configs
+            ]
+            for name in ("report", "cache", "profile"):
+                if isinstance(path := plugin.settings.get(name), str):
+                    plugin.settings[name] = str(project / path)
+            # The projects share the pool of --jobs, rather than each starting its own.
+            plugin.settings["jobs"] = 1
+            exit_code = plugin.export_all(io, self.name)
+        # Poetry may fail in any way on a broken project, which mustn't stop the
+        # other projects.
+        except Exception as error:  # noqa: BLE001
+            io.write_error_line(f"<error>Failed to export {project}:</> {error}")
+            exit_code = 1
+        return exit_code, io.fetch_output(), io.fetch_error()
+
+
+class WaitCommand(Command):
+    name = "auto-export wait"
+    description = "Wait for the exports running in the background to finish."
+    options = [
+        option(
+            "timeout",
+            None,
+            "Seconds to wait at most, by default until they finish.",
+            flag=False,
+        ),
+    ]
+    help = """\
+With the <comment>background</> setting, the exports run in a worker process after <info>poetry lock</>
+returns. The <info>auto-export wait</info> command waits for that worker, prints its output and
+exits with its exit code.
+"""
+
+    def __init__(self, plugin: "PoetryAutoExport"):
+        super().__init__()
+        self.plugin = plugin
+
+    def handle(self) -> int:
+        from poetry_auto_export import background
+
+        timeout = self.option("timeout")
+        try:
+            timeout = None if timeout is None else float(timeout)
+        except ValueError:
+            self.line_error("<error>--timeout must be a number.</>")
+            return 1
+
+        try:
+            status = background.wait(self.poetry.locker.lock.parent, timeout)
+        except (TimeoutError, RuntimeError) as error:
+            self.line_error(f"<error>{error}</>")
+            return 1
+        if not status:
+            self.line("No exports ran in the background.")
+            return 0
+        self.io.write(status.get("output", ""))
+        return status.get("exit_code", 1)
+
+
+def find_projects(root: Path) -> list[Path]:
+    """Find the locked Poetry projects configured for export under `root`.
+
+    Only the text of each pyproject.toml is searched for the configuration, the
+    projects are loaded by Poetry when they are exported.
+    """
+    projects = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(
+            d for d in subdirectories if not d.startswith(".") and d not in SKIP_DIRS
+        )
+        if "pyproject.toml" not in files or "poetry.lock" not in files:
+            continue
+        project = Path(directory)
+        try:
+            pyproject = (project / "pyproject.toml").read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            continue
+        if "[tool.poetry-auto-export" in pyproject:
+            projects.append(project)
+    return projects
+
+
+COMMANDS = {
+    command.name: command
+    for command in (AutoExportCommand, WatchCommand, AllCommand, WaitCommand)
+}
@@ -0,0 +1,179 @@
+"""The export targets configured under [tool.poetry-auto-export]."""
+
+import re
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+
+INVALID_CONFIG = "Invalid pyproject.toml at [tool.poetry-auto-export]"
+FINGERPRINTS = ("lock", "content")
+# Formats with a line per requirement, which the plugin can split, patch and
+# fingerprint by content. Other formats, like `pylock.toml`, are exported as is.
+REQUIREMENTS_FORMATS = (None, "requirements.txt", "constraints.txt")
+PYLOCK_FORMAT = "pylock.toml"
+# PEP 751 only allows `pylock.toml` and `pylock.<name>.toml` as file names.
+PYLOCK_NAME = re.compile(r"pylock(\.[^.]+)?\.toml")
+# Ways to split an export by package, and the parts each one writes.
+SPLITS = {"native": ("native", "pure")}
+
+# Options named differently from their keys in pyproject.toml, which are python keywords.
+ALIASES = {"with_groups": "with"}
+
+
+@dataclass(frozen=True, slots=True)
+class Export:
+    """A single export target, validated once when pyproject.toml is parsed.
+
+    The options are those of `poetry export`, under their names in pyproject.toml,
+    except `with`, which is a python keyword and is kept as `with_groups`. Being
+    immutable, an export can be reused for any number of runs.
+    """
+
+    output: str
+    format: str | None = None
+    without_hashes: bool = False
+    with_credentials: bool = False
+    without_urls: bool = False
+    all_extras: bool = False
+    only_root: bool = False
+    with_groups: tuple[str, ...] = ()
+    without: tuple[str, ...] = ()
+    only: tuple[str, ...] = ()
+    extras: tuple[str, ...] = ()
+    # Only affect the header and how the file is updated, there are no
+    # matching `poetry export` options.
+    fingerprint: str = "lock"
+    incremental: bool = False
+    # Split the export into several files, see `poetry_auto_export.split`.
+    split: str | None = None
+    shards: int = 1
+    # Keys of the configuration which aren't export options.
+    unknown: tuple[str, ...] = ()
+    # The part of a split export written to `output`, set by `parts`.
+    part: str | None = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Export":
+        """Validate a section of pyproject.toml into an export."""
+        if not isinstance(config.get("output"), str):
+            raise ValueError(f"{INVALID_CONFIG}; output=str is required.")
+        options = {}
+        for field in fields(cls):
+            key = ALIASES.get(field.name, field.name)
+            if key not in config or field.name in ("unknown", "part"):
+                continue
+            value = config[key]
+            if field.type is bool and not isinstance(value, bool):
+                raise ValueError(f"{INVALID_CONFIG}; {key} must be a boolean.")
+            if field.type is int and (
+                isinstance(value, bool) or not isinstance(value, int) or value < 1
+            ):
+                raise ValueError(f"{INVALID_CONFIG}; {key} must be a positive integer.")
+            if field.type == tuple[str, ...]:
+                if not isinstance(value, list) or not all(
+                    isinstance(item, str) for item in value
+                ):
+                    raise ValueError(
+                        f"{INVALID_CONFIG}; {key} must be a list of names."
+                    )
+                value = tuple(value)
+            if field.type == str | None and not isinstance(value, str):
+                raise ValueError(f"{INVALID_CONFIG}; {key} must be a string.")
+            options[field.name] = value
+        if options.get("fingerprint", "lock") not in FINGERPRINTS:
+            raise ValueError(
+                f"{INVALID_CONFIG}; fingerprint must be one of: {', '.join(FINGERPRINTS)}."
+            )
+        if options.get("incremental") and options.get("fingerprint") == "content":
+            raise ValueError(
+                f'{INVALID_CONFIG}; incremental exports require fingerprint = "lock".'
+            )
+        split = options.get("split")
+        if split is not None and split not in SPLITS:
+            raise ValueError(
+                f"{INVALID_CONFIG}; split must be one of: {', '.join(SPLITS)}."
+            )
+        if split and options.get("shards", 1) > 1:
+            raise ValueError(f"{INVALID_CONFIG}; split and shards can't be combined.")
+        if options.get("incremental") and (split or options.get("shards", 1) > 1):
+            raise ValueError(f"{INVALID_CONFIG}; incremental exports can't be split.")
+        if options.get("format") not in REQUIREMENTS_FORMATS and (
+            options.get("incremental")
+            or split
+            or options.get("shards", 1) > 1
+            or options.get("fingerprint") == "content"
+        ):
+            raise ValueError(
+                f"{INVALID_CONFIG}; incremental, split, shards and content fingerprints "
+                "require a requirements.txt or constraints.txt format."
+            )
+        if options.get("format") == PYLOCK_FORMAT and not PYLOCK_NAME.fullmatch(
+            Path(config["output"]).name
+        ):
+            raise ValueError(
+                f"{INVALID_CONFIG}; the output of a pylock.toml export must be named "
+                '"pylock.toml" or "pylock.<name>.toml", e.g. "pylock.dev.toml".'
+            )
+        known = {
+            ALIASES.get(field.name, field.name)
+            for field in fields(cls)
+            if field.name not in ("unknown", "part")
+        }
+        unknown = tuple(sorted(key for key in config if key not in known))
+        return cls(**options, unknown=unknown)
+
+    def parts(self) -> list["Export"]:
+        """The files this export is written to, one per part if it's split.
+
+        Each part is written next to `output`, with the name of the part appended
+        to its stem, e.g. `requirements-native.txt` or `requirements-2.txt`.
+        """
+        if self.split:
+            names = SPLITS[self.split]
+        elif self.shards > 1:
+            names = tuple(str(shard) for shard in range(1, self.shards + 1))
+        else:
+            return [self]
+        output = Path(self.output)
+        return [
+            replace(
+                self,
+                output=str(output.with_name(f"{output.stem}-{name}{output.suffix}")),
+                part=name,
+            )
+            for name in names
+        ]
+
+    def options(self) -> dict:
+        """The options which differ from the defaults, under their keys in pyproject.toml.
+
+        The output path is left out, so moving a file doesn't change them. Lists
+        are sorted, because their order doesn't change what is exported.
+        """
+        options = {}
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if field.name in ("output", "unknown") or value == field.default:
+                continue
+            if isinstance(value, tuple):
+                value = sorted(value)
+            options[ALIASES.get(field.name, field.name)] = value
+        return options
+
+    def args(self) -> str:
+        """The arguments of the equivalent `poetry export` command."""
+        args = [f"-o {self.output!r}"]
+        if self.format:
+            args.append(f"--format {self.format}")
+        for name in (
+            "without_hashes",
+            "with_credentials",
+            "without_urls",
+            "all_extras",
+            "only_root",
+        ):
+            if getattr(self, name):
+                args.append("--" + name.replace("_", "-"))
+        for name in ("with_groups", "without", "only", "extras"):
+            option = ALIASES.get(name, name)
+            args.extend(f"--{option}={value!r}" for value in getattr(self, name))
+        return " ".join(args)
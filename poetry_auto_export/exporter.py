@@ -0,0 +1,282 @@
+import copy
+import dataclasses
+import threading
+from functools import cached_property
+from pathlib import Path
+
+from cleo.io.io import IO
+from cleo.io.null_io import NullIO
+from packaging.utils import NormalizedName, canonicalize_name
+from poetry.core.constraints.version import Version
+from poetry.core.packages.dependency_group import MAIN_GROUP
+from poetry.core.packages.package import Package
+from poetry.packages.locker import Locker
+from poetry.poetry import Poetry
+from poetry.repositories.lockfile_repository import LockfileRepository
+from poetry.repositories.repository_pool import RepositoryPool
+from poetry_plugin_export.exporter import Exporter
+
+from poetry_auto_export.config import PYLOCK_FORMAT, Export
+
+
+class _SharedPackageInfo:
+    """Wrap `TransitivePackageInfo` to compute the marker of each group set once."""
+
+    def __init__(self, info):
+        self._info = info
+        self._markers: dict[frozenset, object] = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self._info, name)
+
+    def get_marker(self, groups):
+        key = frozenset(groups)
+        if key not in self._markers:
+            self._markers[key] = self._info.get_marker(groups)
+        return self._markers[key]
+
+
+class SharedLocker:
+    """Wrap a poetry `Locker` so the locked packages are loaded only once.
+
+    Every call to `Locker.locked_repository` or `Locker.locked_packages` parses
+    the whole lock file again. Exporting several targets would pay for that once
+    per target, so the results are kept here and handed out to each of them.
+    """
+
+    def __init__(self, locker: Locker):
+        self._locker = locker
+        self._loading = threading.Lock()
+        self._repository: LockfileRepository | None = None
+        self._packages: dict[Package, _SharedPackageInfo] | None = None
+
+    def __getattr__(self, name: str):
+        return getattr(self._locker, name)
+
+    def locked_repository(self) -> LockfileRepository:
+        with self._loading:
+            if self._repository is None:
+                self._repository = self._locker.locked_repository()
+        return self._repository
+
+    def locked_packages(self) -> dict[Package, _SharedPackageInfo]:
+        with self._loading:
+            if self._packages is None:
+                self._packages = {
+                    package: _SharedPackageInfo(info)
+                    for package, info in self._locker.locked_packages().items()
+                }
+        # The dependency walker overwrites `package.marker` for the export at hand,
+        # so each export gets its own shallow copies of the packages.
+        return {copy.copy(package): info for package, info in self._packages.items()}
+
+
+class _SharedPool:
+    """Wrap a poetry `RepositoryPool` so each locked package is looked up only once.
+
+    Exporting `pylock.toml` looks up the URL of every file of every package in
+    its repository, which usually means a request to the index. Targets of the
+    same project share most of their packages, so the results are kept here.
+    """
+
+    def __init__(self, pool: RepositoryPool):
+        self._pool = pool
+        self._looking_up = threading.Lock()
+        self._packages: dict[tuple, tuple[threading.Lock, list[Package]]] = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self._pool, name)
+
+    def package(
+        self, name: str, version: Version, repository_name: str | None = None
+    ) -> Package:
+        key = (name, str(version), repository_name)
+        with self._looking_up:
+            lock, found = self._packages.setdefault(key, (threading.Lock(), []))
+        with lock:
+            if not found:
+                found.append(self._pool.package(name, version, repository_name))
+        return found[0]
+
+
+class _SharedPoetry:
+    """A view of `Poetry` which reads the lock file through a `SharedLocker`."""
+
+    def __init__(self, poetry: Poetry):
+        self._poetry = poetry
+        self.locker = SharedLocker(poetry.locker)
+
+    @cached_property
+    def pool(self) -> _SharedPool:
+        return _SharedPool(self._poetry.pool)
+
+    def __getattr__(self, name: str):
+        return getattr(self._poetry, name)
+
+
+class _PartialPoetry:
+    """A view of `Poetry` which only sees some of the packages in `poetry.lock`."""
+
+    def __init__(self, poetry: Poetry, lock_entries: list[dict]):
+        self._poetry = poetry
+        self.locker = copy.copy(poetry.locker)
+        self.locker._lock_data = {**poetry.locker.lock_data, "package": lock_entries}
+
+    def __getattr__(self, name: str):
+        return getattr(self._poetry, name)
+
+
+class _ContentIO(NullIO):
+    """Keep what `Exporter.export` writes as is.
+
+    A `BufferedIO` would run the export through the output formatter and copy it
+    into a buffer and out again, which for large exports with hashes means
+    several copies of a multi-megabyte string.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.content: list[str] = []
+
+    def write(self, messages, new_line: bool = False, *args, **kwargs):
+        self.content.extend([messages] if isinstance(messages, str) else messages)
+        if new_line:
+            self.content.append("\n")
+
+
+class ExportEngine:
+    """Export all targets of a project from a single load of `poetry.lock`.
+
+    This does the same as `poetry export`, without going through the command line
+    and re-reading the lock file for every target.
+    """
+
+    def __init__(self, poetry: Poetry, io: IO):
+        self._poetry = _SharedPoetry(poetry)
+        self._io = io
+        self._rendering = threading.Lock()
+        self._whole_exports: dict[Export, tuple[threading.Lock, list[str]]] = {}
+        self._fresh: bool | None = None
+
+    @property
+    def lock_data(self) -> dict:
+        return self._poetry._poetry.locker.lock_data
+
+    def check_fresh(self):
+        """Refuse to export a poetry.lock which is out of date with pyproject.toml.
+
+        Like `poetry export`, which fails in that case. The lock file is checked
+        once for all exports of the engine. `Locker.is_fresh` parses poetry.lock
+        again, so it's only called if the content hash of the lock data already
+        loaded for the exports doesn't match, e.g. for lock files of older poetry.
+        """
+        with self._rendering:
+            if self._fresh is None:
+                locker = self._poetry._poetry.locker
+                if not locker.is_locked():
+                    self._fresh = True
+                else:
+                    content_hash = locker.lock_data.get("metadata", {}).get(
+                        "content-hash"
+                    )
+                    self._fresh = (
+                        content_hash is not None
+                        and content_hash == getattr(locker, "_content_hash", None)
+                    ) or locker.is_fresh()
+        if not self._fresh:
+            raise ValueError(
+                "pyproject.toml changed significantly since poetry.lock was last"
+                " generated. Run `poetry lock` to fix the lock file."
+            )
+
+    def render(self, export: Export, lock_entries: list[dict] | None = None) -> str:
+        """Render a single export target, as `poetry export` would write it.
+
+        With `lock_entries`, only those entries of `poetry.lock` are exported. The
+        parts of a split export are all rendered as the whole export, which is
+        rendered only once for all of them.
+        """
+        self.check_fresh()
+        if export.part and lock_entries is None:
+            return self._render_whole(export)
+        fmt = export.format or Exporter.FORMAT_REQUIREMENTS_TXT
+        if fmt == PYLOCK_FORMAT and not Exporter.is_format_supported(fmt):
+            raise ValueError(
+                "pylock.toml exports require poetry-plugin-export 1.10 or newer."
+            )
+        if not Exporter.is_format_supported(fmt):
+            raise ValueError(f"Invalid export format: {fmt}")
+
+        poetry = self._poetry
+        if lock_entries is not None:
+            poetry = _PartialPoetry(self._poetry._poetry, lock_entries)
+        exporter = Exporter(poetry, self._io)  # type: ignore[arg-type]
+        exporter.only_groups(list(self._groups(export)))
+        exporter.with_extras(list(self._extras(export)))
+        exporter.with_hashes(not export.without_hashes)
+        exporter.with_credentials(export.with_credentials)
+        exporter.with_urls(not export.without_urls)
+        # Relative paths in the output are resolved against the output's directory.
+        output = _ContentIO()
+        exporter.export(fmt, (Path.cwd() / export.output).parent, output)
+        # The export is written at once, and joining a single string doesn't copy it.
+        return "".join(output.content)
+
+    def _render_whole(self, export: Export) -> str:
+        """Render the whole export a part is split from, once for all of its parts."""
+        # The parts are written to the same directory, so they only differ by part.
+        key = dataclasses.replace(
+            export, output=str((Path.cwd() / export.output).parent), part=None
+        )
+        with self._rendering:
+            lock, rendered = self._whole_exports.setdefault(key, (threading.Lock(), []))
+        with lock:
+            if not rendered:
+                rendered.append(self.render(dataclasses.replace(export, part=None)))
+        return rendered[0]
+
+    def _groups(self, export: Export) -> set[NormalizedName]:
+        """Resolve the dependency groups to export, like `poetry export` does."""
+        if export.only_root:
+            return set()
+        # Like the options of `poetry export`, entries may list several groups.
+        selected = {
+            key: {
+                canonicalize_name(group.strip())
+                for entry in groups
+                for group in entry.split(",")
+            }
+            for key, groups in (
+                ("with", export.with_groups),
+                ("without", export.without),
+                ("only", export.only),
+            )
+        }
+        package = self._poetry.package
+        for groups in selected.values():
+            for group in groups:
+                if not package.has_dependency_group(group):
+                    raise ValueError(f"Group not found: {group}")
+        return selected["only"] or ({MAIN_GROUP} | selected["with"]).difference(
+            selected["without"]
+        )
+
+    def _extras(self, export: Export) -> set[NormalizedName]:
+        """Resolve the extras to export, like `poetry export` does."""
+        package_extras = self._poetry.package.extras.keys()
+        if export.extras and export.all_extras:
+            raise ValueError(
+                "You cannot specify explicit extras while exporting all extras."
+            )
+        if export.all_extras:
+            return set(package_extras)
+        extras = {
+            canonicalize_name(extra)
+            for extra_option in export.extras
+            for extra in extra_option.split()
+        }
+        if invalid_extras := extras - package_extras:
+            raise ValueError(
+                f"Extra [{', '.join(sorted(invalid_extras))}] is not specified."
+            )
+        return extras
@@ -0,0 +1,93 @@
+"""Patch the entries of changed packages into an existing export.
+
+With lock files of version 2.1 and later, every package records its own groups
+and markers, so each line of an export only depends on the lock entry of that
+package and the export options. After a change to the lock file, only the lines
+of packages whose entries changed need to be rendered again; all other lines can
+be kept as they are.
+"""
+
+import re
+
+# e.g. `requests[socks]==2.32.3 ; ...` or `mypackage @ file:///...`
+ENTRY_NAME_PATTERN = re.compile(
+    r"([A-Za-z0-9][A-Za-z0-9._-]*)(?:\[[^\]]*\])?(?:==| @ )"
+)
+
+
+def changed_packages(old_lock: str, new_lock: str) -> set[str] | None:
+    """Names of the packages whose lock entries were added, removed or changed.
+
+    Poetry writes the entries of `poetry.lock` deterministically, so the entries
+    are compared as text, without parsing either file. Returns None if the exports
+    can't be patched, because either lock file predates per-package markers or
+    the supported python versions changed.
+    """
+    old_packages, old_metadata = _split_lock(old_lock)
+    new_packages, new_metadata = _split_lock(new_lock)
+    for metadata in (old_metadata, new_metadata):
+        version = re.search(r'^lock-version = "([0-9.]+)"', metadata, re.MULTILINE)
+        if not version or tuple(map(int, version.group(1).split("."))) < (2, 1):
+            return None
+    if _python_versions(old_metadata) != _python_versions(new_metadata):
+        return None
+    changed = set()
+    for entry in old_packages.symmetric_difference(new_packages):
+        if not (name := re.search(r'^name = "([^"]+)"', entry, re.MULTILINE)):
+            return None
+        changed.add(canonicalize_name(name.group(1)))
+    return changed
+
+
+def plan_patch(body: str, changed: set[str]) -> list[str] | None:
+    """Keep the entries of unchanged packages from the body of an export.
+
+    Returns None if an entry can't be attributed to a package, like the
+    index URLs or editable installs.
+    """
+    kept = []
+    for entry in split_entries(body):
+        name = entry_name(entry)
+        if name is None:
+            return None
+        if name not in changed:
+            kept.append(entry)
+    return kept
+
+
+def merge(kept: list[str], rendered: str) -> str | None:
+    """Merge the rendered entries of changed packages with the kept ones.
+
+    The entries are sorted the same way `poetry export` sorts them, so the
+    result is the same as that of a full export.
+    """
+    entries = split_entries(rendered)
+    if any(entry_name(entry) is None for entry in entries):
+        return None
+    return "\n".join(sorted(set(kept) | set(entries))) + "\n"
+
+
+def split_entries(body: str) -> list[str]:
+    """Split an export into entries, keeping the `--hash` continuation lines."""
+    return [entry for entry in re.split(r"\n(?! )", body.rstrip("\n")) if entry]
+
+
+def entry_name(entry: str) -> str | None:
+    if match := ENTRY_NAME_PATTERN.match(entry):
+        return canonicalize_name(match.group(1))
+    return None
+
+
+def canonicalize_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _split_lock(lock: str) -> tuple[set[str], str]:
+    """Split the text of `poetry.lock` into its package entries and its metadata."""
+    packages, _, metadata = lock.partition("\n[metadata]\n")
+    return set(packages.split("[[package]]\n")[1:]), metadata
+
+
+def _python_versions(metadata: str) -> str | None:
+    match = re.search(r"^python-versions = (.*)$", metadata, re.MULTILINE)
+    return match.group(1) if match else None
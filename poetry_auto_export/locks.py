@@ -0,0 +1,67 @@
+"""Advisory locks on files, shared by the poetry processes of a project.
+
+These are `flock` locks: they are released when the process holding them exits,
+even if it crashes, and are inherited by the subprocesses it starts. They are
+only available on POSIX systems, see `SUPPORTED`.
+"""
+
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+SUPPORTED = fcntl is not None
+
+
+class FileLock:
+    """An advisory lock on `path`, held through an open file descriptor.
+
+    With `fd`, the lock is already held through that descriptor, e.g. one inherited
+    from the process which acquired it.
+    """
+
+    def __init__(self, path: Path, fd: int | None = None):
+        self.path = path
+        self.fd = fd
+
+    def acquire(self, blocking: bool = True, shared: bool = False) -> bool:
+        """Acquire the lock, returning whether it was acquired."""
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.fd, flags)
+        except BlockingIOError:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        """Close the descriptor, which releases the lock unless a subprocess inherited it."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on `path` for the `with` block, where locks are supported."""
+    if not SUPPORTED:
+        yield
+        return
+    with FileLock(path):
+        yield
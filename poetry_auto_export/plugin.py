@@ -1,38 +1,163 @@
 import hashlib
+import json
+import re
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from functools import cached_property
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from cleo.events.console_events import TERMINATE
+from cleo.events.console_command_event import ConsoleCommandEvent
+from cleo.events.console_events import COMMAND, TERMINATE
 from cleo.events.console_terminate_event import ConsoleTerminateEvent
 from cleo.events.event import Event
 from cleo.events.event_dispatcher import EventDispatcher
-from cleo.io.outputs.output import Output, Verbosity
-from poetry.console.application import Application
-from poetry.console.commands.add import AddCommand
-from poetry.console.commands.lock import LockCommand
-from poetry.console.commands.remove import RemoveCommand
-from poetry.console.commands.update import UpdateCommand
+from cleo.io.io import IO
+from cleo.io.outputs.output import Verbosity
 from poetry.plugins.application_plugin import ApplicationPlugin
-from poetry_plugin_export.command import ExportCommand
-from tomlkit.container import Container
 
-Export = dict
+from poetry_auto_export import atomic, chunks
+from poetry_auto_export.config import Export
+from poetry_auto_export.locks import locked
+from poetry_auto_export.state import STATE_FILE, Stat, StatCache, file_stat
+
+if TYPE_CHECKING:
+    # The plugin is loaded on every poetry invocation, so anything heavier than
+    # the above is only imported once an export actually runs.
+    from poetry.console.application import Application
+    from poetry.poetry import Poetry
+    from tomlkit.container import Container
+
+    from poetry_auto_export.cache import ExportCache
+    from poetry_auto_export.exporter import ExportEngine
+    from poetry_auto_export.profiling import Profiler
+
+Settings = dict
+Report = dict
+# The hash of the previous poetry.lock, the names of the changed packages
+# and the data of the new poetry.lock.
+LockChange = tuple[str, set[str], dict]
+
+SETTINGS_KEYS = (
+    "jobs",
+    "hash_algorithm",
+    "report",
+    "cache",
+    "cache_size_mb",
+    "stat_cache",
+    "background",
+    "profile",
+)
+HASH_ALGORITHMS = ("sha1", "sha256", "sha384", "sha512", "blake2b", "blake2s")
+DEFAULT_HASH_ALGORITHM = "sha1"
+HASH_CHUNK_SIZE = 1 << 16
+# The start of a line with a requirement, after the first line.
+_REQUIREMENT_START = re.compile(r"\n(?=[^\W_]|-e )")
+LOCK_COMMANDS = ("lock", "update", "add", "remove")
+# The start of the error poetry raises when there's no pyproject.toml.
+MISSING_PYPROJECT = "Poetry could not find a pyproject.toml file"
+# The commands of the plugin, see `poetry_auto_export.commands`.
+COMMANDS = ("auto-export", "auto-export watch", "auto-export all", "auto-export wait")
 
 
 class PoetryAutoExport(ApplicationPlugin):
-    def activate(self, application: Application):
+    # The contents of poetry.lock before the running command changed it.
+    _previous_lock: bytes | None = None
+    # The project to export, when it isn't the one of the application.
+    _poetry: "Poetry | None" = None
+    # poetry.lock and its stat when it was last hashed, see `_is_superseded`.
+    _hashed_lock: tuple[Path, "Stat | None"] | None = None
+
+    def activate(self, application: "Application"):
         if not application.event_dispatcher:
             return
-        try:
-            application.poetry
-        except RuntimeError:
-            return
-        self.configs = self._parse_pyproject(application.poetry.pyproject.data)
         self.application = application
 
+        application.event_dispatcher.add_listener(COMMAND, self.remember_lock)
         application.event_dispatcher.add_listener(TERMINATE, self.run_exports)
+        for name in COMMANDS:
+            if not application.command_loader.has(name):
+                application.command_loader.register_factory(
+                    name, self._load_command(name)
+                )
         return super().activate(application)
 
-    def _parse_pyproject(self, pyproject: Container) -> list[Export]:
+    def _load_command(self, name: str):
+        """Import a command of the plugin only when it runs."""
+
+        def load():
+            from poetry_auto_export.commands import COMMANDS
+
+            return COMMANDS[name](self)
+
+        return load
+
+    def remember_lock(self, event: Event, event_name: str, dispatcher: EventDispatcher):
+        """Keep poetry.lock as it was before a command which modifies it.
+
+        Incremental exports compare it with the new poetry.lock, to find the
+        packages which changed.
+        """
+        if not isinstance(event, ConsoleCommandEvent):
+            return
+        if event.command.name not in LOCK_COMMANDS:
+            return
+        if not any(export.incremental for export in self.configs):
+            return
+        try:
+            self._previous_lock = self.poetry.locker.lock.read_bytes()
+        except (RuntimeError, AttributeError, OSError):
+            self._previous_lock = None
+
+    @property
+    def poetry(self) -> "Poetry":
+        if self._poetry is None:
+            return self.application.poetry
+        return self._poetry
+
+    def set_poetry(self, poetry: "Poetry"):
+        """Export the targets of `poetry`, instead of those of the application."""
+        self._poetry = poetry
+
+    def reset(self):
+        """Forget everything read from pyproject.toml, to read it again when it changed."""
+        for name in ("configs", "settings", "_stat_cache", "_export_cache"):
+            self.__dict__.pop(name, None)
+
+    @cached_property
+    def settings(self) -> Settings:
+        pyproject = self._pyproject_data()
+        if pyproject is None:
+            return Settings()
+        return self._parse_settings(pyproject)
+
+    @cached_property
+    def configs(self) -> list[Export]:
+        pyproject = self._pyproject_data()
+        if pyproject is None:
+            return []
+        return self._parse_pyproject(pyproject)
+
+    def _pyproject_data(self) -> "Container | None":
+        """The contents of pyproject.toml, or None if there is none.
+
+        Poetry raises a RuntimeError for a missing pyproject.toml, as it does for an
+        invalid one, which must not pass for a project without configuration.
+        """
+        try:
+            return self.poetry.pyproject.data
+        except RuntimeError as error:
+            if MISSING_PYPROJECT in str(error):
+                return None
+            raise
+
+    @property
+    def targets(self) -> list[Export]:
+        """The files to export: the configured exports, split ones into their parts."""
+        return [part for export in self.configs for part in export.parts()]
+
+    def _parse_pyproject(self, pyproject: "Container") -> list[Export]:
         """Parse the pyproject.toml file for export configuration(s)."""
         configs: list[Export] = []
         tools = pyproject["tool"]
@@ -45,7 +170,7 @@ class PoetryAutoExport(ApplicationPlugin):
             raise ValueError(
                 "pyproject.toml: [tool.poetry-auto-export] must be an object!"
             )
-        exports_list = full_config.pop("exports", None)
+        exports_list = full_config.get("exports")
         if exports_list and not isinstance(exports_list, list):
             raise ValueError(
                 "pyproject.toml: [tool.poetry-auto-export.exports]; must be a list!"
@@ -60,121 +185,771 @@ class PoetryAutoExport(ApplicationPlugin):
 
         return configs
 
-    def _parse_pyproject_section(self, config: dict) -> Export | None:
-        """Parse an individual export section. This can be top-level or and element of the `exports` list."""
-        if config and not isinstance(config.get("output"), str):
+    def _parse_settings(self, pyproject: "Container") -> Settings:
+        """Parse the plugin-wide settings from the top level of [tool.poetry-auto-export]."""
+        tools = pyproject.get("tool")
+        full_config = (
+            tools.get("poetry-auto-export") if isinstance(tools, dict) else None
+        )
+        if not isinstance(full_config, dict):
+            return Settings()
+        settings = Settings(
+            (key, full_config[key]) for key in SETTINGS_KEYS if key in full_config
+        )
+        jobs = settings.get("jobs", 1)
+        if isinstance(jobs, bool) or not isinstance(jobs, int) or jobs < 1:
             raise ValueError(
-                "Invalid pyproject.toml at [tool.poetry-auto-export]; output=str is required."
+                "Invalid pyproject.toml at [tool.poetry-auto-export]; jobs must be a positive integer."
             )
-        config.pop("exports", None)
+        algorithm = settings.get("hash_algorithm", DEFAULT_HASH_ALGORITHM)
+        if algorithm not in HASH_ALGORITHMS:
+            raise ValueError(
+                "Invalid pyproject.toml at [tool.poetry-auto-export]; "
+                f"hash_algorithm must be one of: {', '.join(HASH_ALGORITHMS)}."
+            )
+        if not isinstance(settings.get("report", ""), str):
+            raise ValueError(
+                "Invalid pyproject.toml at [tool.poetry-auto-export]; report must be a path."
+            )
+        for key in ("cache", "profile"):
+            if not isinstance(settings.get(key, False), (bool, str)):
+                raise ValueError(
+                    f"Invalid pyproject.toml at [tool.poetry-auto-export]; {key} must be a boolean or a path."
+                )
+        cache_size = settings.get("cache_size_mb", 1)
+        if (
+            isinstance(cache_size, bool)
+            or not isinstance(cache_size, int)
+            or cache_size < 1
+        ):
+            raise ValueError(
+                "Invalid pyproject.toml at [tool.poetry-auto-export]; cache_size_mb must be a positive integer."
+            )
+        for key in ("stat_cache", "background"):
+            if not isinstance(settings.get(key, False), bool):
+                raise ValueError(
+                    f"Invalid pyproject.toml at [tool.poetry-auto-export]; {key} must be a boolean."
+                )
+        return settings
+
+    def _parse_pyproject_section(self, config: dict) -> Export | None:
+        """Parse an individual export section. This can be top-level or and element of the `exports` list."""
+        config = {
+            k: v for k, v in config.items() if k not in SETTINGS_KEYS and k != "exports"
+        }
         if not config:
             return None
-        return Export(config)
-
-    def _prepare_export_args(self, export: Export, output: Output):
-        """Prepare arguments for the export command."""
-        options = []
-        if output := export.pop("output", None):
-            options.append(f" -o {output!r}")
-        if format := export.pop("format", None):
-            options.append(f"--format {format}")
-
-        if export.pop("without_hashes", None):
-            options.append("--without-hashes")
-        if export.pop("with_credentials", None):
-            options.append("--with-credentials")
-        if export.pop("without_urls", None):
-            options.append("--without-urls")
-        if export.pop("all_extras", None):
-            options.append("--all-extras")
-        if export.pop("only_root", None):
-            options.append("--only-root")
-
-        if groups := export.pop("with", []):
-            for group in groups:
-                options.append(f"--with={group!r}")
-        if groups := export.pop("without", []):
-            for group in groups:
-                options.append(f"--without={group!r}")
-        if groups := export.pop("only", []):
-            for group in groups:
-                options.append(f"--only={group!r}")
-        if extras := export.pop("extras", []):
-            for extra in extras:
-                options.append(f"--extras={extra!r}")
-        if export:
-            output.write_line(f"<fg=red>Unknown export options:</> {export}")
-        return " ".join(options).strip()
+        return Export.from_config(config)
 
     def run_exports(self, event: Event, event_name: str, dispatcher: EventDispatcher):
         if not isinstance(event, ConsoleTerminateEvent):
             return
         if event.exit_code:
             return
-        if isinstance(event.command, ExportCommand):
+        if event.command.name == "export":
             return
-        if not isinstance(
-            event.command, (LockCommand, UpdateCommand, AddCommand, RemoveCommand)
-        ):
+        if event.command.name not in LOCK_COMMANDS:
             event.io.write_line(
                 "Skipping requirements export as command is not modifying lock file.",
                 Verbosity.VERY_VERBOSE,  # type: ignore
             )
             return
 
+        if self.settings.get("background") and self._export_in_background(event.io):
+            return
+        if exit_code := self.export_all(event.io, event.command.name):
+            event.set_exit_code(exit_code)
+
+    def _export_in_background(self, io: IO) -> bool:
+        """Hand the exports to a worker process, see `poetry_auto_export.background`.
+
+        Returns False if they have to run in this process instead.
+        """
+        from poetry_auto_export import background
+        from poetry_auto_export.locks import SUPPORTED
+
         if not self.configs:
-            event.io.write_line(
+            return False
+        if not SUPPORTED:
+            io.write_line(
+                "Exporting in the foreground, as background exports need file locks.",
+                Verbosity.VERBOSE,  # type: ignore
+            )
+            return False
+        try:
+            lock_file = self.poetry.locker.lock
+        except (RuntimeError, AttributeError):
+            return False
+        background.start(self.poetry.pyproject_path.parent, lock_file.parent)
+        io.write_line(
+            "<fg=blue>Exporting dependencies in the background</> "
+            "<fg=dark_gray>(wait for it with `poetry auto-export wait`)</>"
+        )
+        return True
+
+    def export_all(self, io: IO, command_name: str) -> int:
+        """Export every configured target, skipping those which are up to date.
+
+        With the `profile` setting, the run and each of its targets are profiled, see
+        `poetry_auto_export.profiling`. Returns the exit code: 1 if any target failed,
+        0 otherwise.
+        """
+        if not self.configs:
+            io.write_line(
                 "Skipping requirements export as no configuration was found.",
                 Verbosity.VERY_VERBOSE,  # type: ignore
             )
-            return
-        lock_hash = self._compute_poetry_lock_hash()
+            return 0
+        profiler = self._create_profiler()
+        if profiler is None:
+            return self._export_all(io, command_name)
+        with profiler.profile():
+            exit_code = self._export_all(io, command_name, profiler)
+        self._save_profiles(io, profiler)
+        return exit_code
+
+    def _export_all(
+        self, io: IO, command_name: str, profiler: "Profiler | None" = None
+    ) -> int:
+        started = time.perf_counter()
+        durations: dict[str, float] = {}
+        with _timed(durations, "lock_hash"):
+            lock_hash = self._compute_poetry_lock_hash()
+        if profiler:
+            profiler.lock_hash = lock_hash
         if not lock_hash:
-            event.io.write_line(
+            io.write_line(
                 "Could not find poetry.lock file, so hash will be missing.",
                 Verbosity.NORMAL,  # type: ignore
             )
-        for export in self.configs:
-            self._run_export(event, export, lock_hash)
+        engine = self._create_engine(io)
+        pending: list[tuple[Export, str, Report]] = []
+        reports: list[Report] = []
+        for export in self.targets:
+            out_file = Path(export.output)
+            report = Report(
+                output=export.output,
+                status="skipped",
+                durations={},
+                bytes=0,
+                packages=None,
+                error=None,
+            )
+            reports.append(report)
+            with _timed(report["durations"], "check"):
+                options_hash = self._compute_options_hash(export)
+                up_to_date = self._is_up_to_date(export, lock_hash, options_hash)
+            if up_to_date:
+                io.write_line(
+                    f"<fg=blue>Skipping export to</> {out_file} "
+                    "<fg=dark_gray>(poetry.lock and options unchanged)</>"
+                )
+                continue
+            if export.unknown:
+                io.write_line(
+                    f"<fg=red>Unknown export options:</> {', '.join(export.unknown)}"
+                )
+            io.write_line(f"<fg=blue>Exporting dependencies to</> {out_file}")
+            io.write_line(
+                f"> <fg=dark_gray>poetry export {export.args()}</>",
+                Verbosity.VERBOSE,  # type: ignore
+            )
+            pending.append((export, options_hash, report))
+
+        lock_change = None
+        if lock_hash and any(export.incremental for export, _, _ in pending):
+            lock_change = self._diff_lock(engine)
+
+        def run(target: tuple[Export, str, Report]) -> Exception | None:
+            export, options_hash, report = target
+            try:
+                with profiler.profile(export.output) if profiler else nullcontext():
+                    self._run_export(
+                        engine, export, lock_hash, options_hash, report, lock_change
+                    )
+            # Besides our ValueErrors and OSErrors, poetry and poetry-plugin-export
+            # may fail in any way, e.g. with a KeyError on a malformed poetry.lock.
+            # A failed target is reported without stopping the others.
+            except Exception as error:  # noqa: BLE001
+                report.update(status="failed", error=str(error))
+                return error
+            return None
+
+        # A profiler only profiles one target at a time.
+        errors = self._map_targets(run, pending, concurrent=profiler is None)
+        exit_code = 0
+        for (export, options_hash, report), error in zip(pending, errors):
+            if error:
+                io.write_error_line(
+                    f"<error>Failed to export dependencies to {export.output}:</> {error}"
+                )
+                exit_code = 1
+            elif report["status"] == "superseded":
+                io.write_line(
+                    f"<fg=blue>Not writing</> {export.output} "
+                    "<fg=dark_gray>(poetry.lock changed while exporting, "
+                    "run `poetry auto-export` unless another poetry command exports it)</>"
+                )
+            elif lock_hash and self._stat_cache:
+                self._stat_cache.record_export(
+                    Path(export.output), lock_hash, options_hash
+                )
+        if self._stat_cache:
+            self._stat_cache.save()
+
+        if report_path := self.settings.get("report"):
+            durations["total"] = time.perf_counter() - started
+            self._write_report(
+                Path(report_path),
+                Report(
+                    command=command_name,
+                    exit_code=exit_code,
+                    hash_algorithm=self.hash_algorithm,
+                    lock_hash=lock_hash,
+                    durations=durations,
+                    targets=reports,
+                ),
+            )
+            io.write_line(
+                f"Wrote the export report to {report_path}",
+                Verbosity.VERBOSE,  # type: ignore
+            )
+        return exit_code
+
+    def check_all(self, io: IO, diff: bool = False) -> int:
+        """Compare every configured target with its file, without writing anything.
+
+        The targets are rendered in memory, the same way they would be exported,
+        and compared with the files in full. With `diff`, the differences are
+        printed. Returns the exit code: 1 if any file is out of date, 0 otherwise.
+        """
+        if not self.configs:
+            io.write_line(
+                "Skipping requirements check as no configuration was found.",
+                Verbosity.VERY_VERBOSE,  # type: ignore
+            )
+            return 0
+        lock_hash = self._compute_poetry_lock_hash()
+        engine = self._create_engine(io)
+
+        def render(export: Export) -> tuple[str, str] | Exception:
+            options_hash = self._compute_options_hash(export)
+            try:
+                header, body, _ = self._render_export(
+                    engine, export, lock_hash, options_hash, fill_cache=False
+                )
+            # Like in `_export_all`, a target failing in any way is reported
+            # without stopping the others.
+            except Exception as error:  # noqa: BLE001
+                return error
+            return header, body
+
+        targets = self.targets
+        contents = self._map_targets(render, targets)
+        exit_code = 0
+        for export, content in zip(targets, contents):
+            out_file = Path(export.output)
+            if isinstance(content, Exception):
+                io.write_error_line(
+                    f"<error>Failed to export dependencies to {out_file}:</> {content}"
+                )
+                exit_code = 1
+                continue
+            if _file_matches(out_file, *content):
+                io.write_line(f"<fg=blue>Up to date:</> {out_file}")
+                continue
+            exit_code = 1
+            state = "Out of date" if out_file.exists() else "Missing"
+            io.write_error_line(f"<error>{state}:</> {out_file}")
+            if diff:
+                try:
+                    current = out_file.read_text(encoding="utf-8")
+                except (OSError, UnicodeDecodeError):
+                    current = ""
+                io.write(_format_diff(out_file, current, "".join(content)))
+        return exit_code
+
+    def _map_targets(self, function, targets: list, concurrent: bool = True) -> list:
+        """Call `function` on each target, concurrently if `jobs` is set.
+
+        Targets are independent of each other, so they can be handled concurrently.
+        The results are returned in the order of the configuration.
+        """
+        jobs = min(self.settings.get("jobs", 1), len(targets)) if concurrent else 1
+        if jobs > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                return list(pool.map(function, targets))
+        return list(map(function, targets))
+
+    def _is_up_to_date(
+        self, export: Export, lock_hash: str | None, options_hash: str
+    ) -> bool:
+        """Whether an export was made from the current poetry.lock and options.
+
+        With the stat cache, an export which is unchanged since it was last up to
+        date isn't even opened. Otherwise, the header of lock fingerprints is read.
+        """
+        if not lock_hash:
+            return False
+        out_file = Path(export.output)
+        if self._stat_cache and self._stat_cache.is_exported(
+            out_file, lock_hash, options_hash
+        ):
+            return True
+        if export.fingerprint != "lock":
+            return False
+        header = self._read_header(out_file)
+        if header != (self.hash_algorithm, lock_hash, options_hash):
+            return False
+        if self._stat_cache:
+            self._stat_cache.record_export(out_file, lock_hash, options_hash)
+        return True
+
+    def _create_profiler(self) -> "Profiler | None":
+        """The profiler of a run, if the `profile` setting or the environment enable it."""
+        from poetry_auto_export import profiling
+
+        try:
+            default = self.poetry.locker.lock.parent / profiling.DEFAULT_DIRECTORY
+        except (RuntimeError, AttributeError):
+            default = Path(profiling.DEFAULT_DIRECTORY)
+        directory = profiling.directory(self.settings.get("profile", False), default)
+        return profiling.Profiler(directory) if directory else None
+
+    def _save_profiles(self, io: IO, profiler: "Profiler"):
+        """Write the profiles of a run, and print where its time went."""
+        try:
+            paths, seconds = profiler.save()
+        except OSError as error:
+            io.write_error_line(f"<warning>Could not write the profile: {error}</>")
+            return
+        total = sum(seconds.values()) or 1.0
+        io.write_line(
+            f"<fg=blue>Wrote the profile to</> {paths[0]} <fg=dark_gray>("
+            + ", ".join(
+                f"{component} {value:.3f}s {value / total:.0%}"
+                for component, value in seconds.items()
+            )
+            + ")</>"
+        )
+        for path in paths[1:]:
+            io.write_line(
+                f"Wrote the profile of a target to {path}",
+                Verbosity.VERBOSE,  # type: ignore
+            )
+
+    def _write_report(self, report_path: Path, report: Report):
+        """Write the timings and outcome of a run as JSON, for build telemetry."""
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_export(report_path, json.dumps(report, indent=2) + "\n")
+
+    def _create_engine(self, io: IO) -> "ExportEngine":
+        """Create the engine shared by all exports of a single run."""
+        from poetry_auto_export.exporter import ExportEngine
+
+        return ExportEngine(self.poetry, io)
 
     def _run_export(
-        self, event: ConsoleTerminateEvent, export: dict, lock_hash: str | None
+        self,
+        engine: "ExportEngine",
+        export: Export,
+        lock_hash: str | None,
+        options_hash: str | None = None,
+        report: Report | None = None,
+        lock_change: "LockChange | None" = None,
     ):
-        out_file = Path(export["output"])
-        args = self._prepare_export_args(export, event.io.output)
-
-        event.io.write_line(f"<fg=blue>Exporting dependencies to</> {out_file}")
-        command_message = f"> <fg=dark_gray>poetry export {args}</>"
-        event.io.write_line(
-            command_message,
-            Verbosity.VERBOSE,  # type: ignore
+        """Render and write a single export, recording the time of each phase in `report`."""
+        report = report if report is not None else Report(durations={})
+        header, body, status = self._render_export(
+            engine, export, lock_hash, options_hash, report["durations"], lock_change
         )
+        report["packages"] = _count_packages(body)
+        out_file = Path(export.output)
+        # Other poetry runs, e.g. of an IDE or a parallel CI job, may export the same
+        # file at the same time. Only the export of the current poetry.lock is written.
+        with _timed(report["durations"], "write"), locked(self._write_lock(out_file)):
+            if lock_hash and self._is_superseded(lock_hash):
+                report.update(status="superseded", bytes=0)
+                return
+            written = self._write_export(out_file, header, body)
+        report["status"] = status if written else "unchanged"
+        report["bytes"] = out_file.stat().st_size if written else 0
+
+    def _write_lock(self, out_file: Path) -> Path:
+        """The lock file guarding the writes of `out_file`, in Poetry's cache directory.
+
+        Keeping them out of the project spares users from ignoring lock files next
+        to every export.
+        """
+        try:
+            directory = Path(self.poetry.config.get("cache-dir"))
+        except (RuntimeError, AttributeError):
+            directory = Path(tempfile.gettempdir())
+        directory /= "auto-export-locks"
+        directory.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha256(str(out_file.resolve()).encode()).hexdigest()
+        return directory / f"{name}.lock"
+
+    def _is_superseded(self, lock_hash: str) -> bool:
+        """Whether poetry.lock changed since `lock_hash` was computed.
+
+        An export of the older poetry.lock must not overwrite one of the newer, which
+        another poetry run may be writing. poetry.lock is only hashed again if its
+        stat changed.
+        """
+        if self._hashed_lock is None:
+            return False
+        lock_file, stat = self._hashed_lock
+        if stat is not None and file_stat(lock_file) == stat:
+            return False
+        try:
+            return _file_digest(lock_file, self.hash_algorithm) != lock_hash
+        except OSError:
+            return True
+
+    def _render_export(
+        self,
+        engine: "ExportEngine",
+        export: Export,
+        lock_hash: str | None,
+        options_hash: str | None = None,
+        durations: dict[str, float] | None = None,
+        lock_change: "LockChange | None" = None,
+        fill_cache: bool = True,
+    ) -> tuple[str, str, str]:
+        """Render a single export, as its header and body are written to its file.
 
-        event.command.call("export", args)
-        if lock_hash:
-            self._prepend_lock_hash(out_file, lock_hash)
+        The header and the body are kept apart, so a large body isn't copied just to
+        prepend the header. Exports are taken from the cache when it's enabled and
+        has them, header included. Incremental exports are patched when
+        `lock_change` allows it, and fully rendered otherwise. The parts of split
+        exports keep only their entries of the whole export. Without `fill_cache`,
+        the cache is only read, e.g. when checking the exports. Also returns how the
+        export was made: "exported", "patched" or "cached".
+        """
+        durations = durations if durations is not None else {}
+        # Checked before the cache too, which may hold exports of a lock file that
+        # was fresh with an earlier pyproject.toml.
+        engine.check_fresh()
+        cache_key = self._cache_key(engine, export, lock_hash, options_hash)
+        if cache_key and self._export_cache:
+            with _timed(durations, "cache"):
+                content = self._export_cache.get(cache_key)
+            if content is not None:
+                return "", content, "cached"
+        with _timed(durations, "render"):
+            content = None
+            if export.incremental and lock_change:
+                content = self._patch_export(engine, export, options_hash, lock_change)
+            patched = content is not None
+            if content is None:
+                content = engine.render(export)
+            if export.part:
+                from poetry_auto_export import split
 
-    def _prepend_lock_hash(self, out_file: Path, lock_hash: str | None):
-        with open(out_file, "r+") as f:
-            content = f.read()
-            f.seek(0, 0)
+                content = split.select(content, export, engine.lock_data)
+        header = ""
+        with _timed(durations, "header"):
             if lock_hash:
-                f.write(f"# poetry.lock hash: {lock_hash}\n")
-            else:
-                f.write("# <missing poetry.lock file>\n")
-            f.write(
-                "# This file is generated by poetry-auto-export\n"
-                "# The SHA1 hash of the poetry.lock file is printed above\n"
+                content_hash = body_hash = None
+                if export.fingerprint == "content":
+                    content_hash = self._compute_content_hash(content)
+                if export.incremental:
+                    body_hash = self._compute_content_hash(content)
+                header = self._format_header(
+                    lock_hash, options_hash, content_hash, body_hash
+                )
+        if cache_key and self._export_cache and fill_cache:
+            self._export_cache.put(cache_key, header, content)
+        return header, content, "patched" if patched else "exported"
+
+    @cached_property
+    def _export_cache(self) -> "ExportCache | None":
+        """The cache of exports, if it's enabled by the `cache` setting."""
+        from poetry_auto_export.cache import DEFAULT_CACHE_SIZE_MB, ExportCache
+
+        cache = self.settings.get("cache", False)
+        if cache is False:
+            return None
+        if cache is True:
+            directory = Path(self.poetry.config.get("cache-dir")) / "auto-export"
+        else:
+            directory = Path(cache)
+        size_mb = self.settings.get("cache_size_mb", DEFAULT_CACHE_SIZE_MB)
+        return ExportCache(directory, size_mb * 2**20)
+
+    def _cache_key(
+        self,
+        engine: "ExportEngine",
+        export: Export,
+        lock_hash: str | None,
+        options_hash: str | None,
+    ) -> str | None:
+        """The key of an export in the cache, or None if it isn't cached.
+
+        Besides the hashes, exports are keyed by the versions of poetry-plugin-export,
+        poetry and poetry-core, which all take part in rendering them, e.g. the
+        markers. Exports with credentials are never cached, so they don't end up in
+        a shared directory. Local packages are exported relative to the output, so projects
+        with any also key their exports by the directory of the output.
+        """
+        if not self._export_cache or not lock_hash or export.with_credentials:
+            return None
+        from importlib.metadata import version
+
+        from poetry_auto_export.cache import ExportCache
+
+        output_dir = None
+        if any(
+            package.get("source", {}).get("type") in ("directory", "file")
+            for package in engine.lock_data.get("package", [])
+        ):
+            output_dir = str((Path.cwd() / export.output).parent)
+        return ExportCache.key(
+            hash_algorithm=self.hash_algorithm,
+            lock_hash=lock_hash,
+            options_hash=options_hash,
+            exporter=version("poetry-plugin-export"),
+            poetry=version("poetry"),
+            poetry_core=version("poetry-core"),
+            output_dir=output_dir,
+        )
+
+    def _format_header(
+        self,
+        lock_hash: str,
+        options_hash: str | None = None,
+        content_hash: str | None = None,
+        body_hash: str | None = None,
+    ) -> str:
+        """Format the header of an exported file.
+
+        By default the header carries the hash of the whole poetry.lock file. With a
+        content fingerprint it carries the hash of the exported dependencies instead,
+        so the file stays valid when the lock changes in ways that don't affect it.
+        Incremental exports also carry the hash of the exported dependencies after
+        the options, to detect edits before patching the file.
+        """
+        label = _hash_label(self.hash_algorithm)
+        algorithm = self.hash_algorithm.upper()
+        if content_hash:
+            header = f"# export content {label}: {content_hash}\n"
+            description = f"# The {algorithm} hash of the exported dependencies is printed above\n"
+        else:
+            header = f"# poetry.lock {label}: {lock_hash}\n"
+            description = (
+                f"# The {algorithm} hash of the poetry.lock file is printed above\n"
+            )
+        if options_hash:
+            header += f"# export options {label}: {options_hash}\n"
+        if body_hash:
+            header += f"# export content {label}: {body_hash}\n"
+        return header + "# This file is generated by poetry-auto-export\n" + description
+
+    def _diff_lock(self, engine: "ExportEngine") -> "LockChange | None":
+        """Find the packages which changed in poetry.lock during the command."""
+        from poetry_auto_export import incremental
+
+        if self._previous_lock is None:
+            return None
+        try:
+            lock_file = self.poetry.locker.lock
+            changed = incremental.changed_packages(
+                self._previous_lock.decode("utf-8"), lock_file.read_text("utf-8")
             )
-            f.write(content)
+        except (RuntimeError, AttributeError, OSError, UnicodeDecodeError):
+            return None
+        if changed is None:
+            return None
+        previous_hash = hashlib.new(self.hash_algorithm, self._previous_lock)
+        return previous_hash.hexdigest(), changed, engine.lock_data
+
+    def _patch_export(
+        self,
+        engine: "ExportEngine",
+        export: Export,
+        options_hash: str | None,
+        lock_change: "LockChange",
+    ) -> str | None:
+        """Render only the changed packages into the existing export.
+
+        Returns None if the export needs to be rendered in full, because the
+        existing file wasn't exported from the previous poetry.lock with the same
+        options, or it was edited since.
+        """
+        from poetry_auto_export import incremental
+
+        previous_hash, changed, lock_data = lock_change
+        try:
+            text = Path(export.output).read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+        header_lines = self._format_header(previous_hash, options_hash, None, "-")
+        parts = text.split("\n", header_lines.count("\n"))
+        body = parts[-1]
+        expected_header = self._format_header(
+            previous_hash, options_hash, None, self._compute_content_hash(body)
+        )
+        if text != expected_header + body:
+            return None
+
+        kept = incremental.plan_patch(body, changed)
+        if kept is None:
+            return None
+        entries = [
+            entry
+            for entry in lock_data.get("package", [])
+            if incremental.canonicalize_name(entry["name"]) in changed
+        ]
+        rendered = engine.render(export, entries) if entries else ""
+        return incremental.merge(kept, rendered)
+
+    def _compute_content_hash(self, content: str) -> str:
+        """Compute a hash of the exported dependencies, without the header."""
+        digest = hashlib.new(self.hash_algorithm)
+        for chunk in chunks.chunks(content):
+            digest.update(chunk.encode())
+        return digest.hexdigest()
+
+    def _write_export(self, out_file: Path, *content: str) -> bool:
+        """Replace the contents of `out_file` atomically, unless they are unchanged.
+
+        The content is given in pieces like a header and a body, and the file keeps
+        its permissions. Returns whether the file was written.
+        """
+        if _file_matches(out_file, *content):
+            return False
+        atomic.write(out_file, *content, keep_mode=True)
+        return True
+
+    def _read_header(self, out_file: Path) -> tuple[str | None, str | None, str | None]:
+        """Read the hash algorithm, lock hash and options hash from an exported file."""
+        try:
+            with open(out_file) as f:
+                first_line, second_line = f.readline(), f.readline()
+        except (OSError, UnicodeDecodeError):
+            return None, None, None
+        algorithm, lock_hash = _parse_hash_line("# poetry.lock ", first_line)
+        options_algorithm, options_hash = _parse_hash_line(
+            "# export options ", second_line
+        )
+        if options_algorithm != algorithm:
+            options_hash = None
+        return algorithm, lock_hash, options_hash
+
+    def _compute_options_hash(self, export: Export) -> str:
+        """Compute a hash of the normalized export options, see `Export.options`."""
+        serialized = json.dumps(export.options(), sort_keys=True, separators=(",", ":"))
+        return hashlib.new(self.hash_algorithm, serialized.encode()).hexdigest()
 
     def _compute_poetry_lock_hash(self) -> str | None:
-        """Compute a SHA1 hash of the poetry.lock file."""
+        """Compute a hash of the poetry.lock file."""
         try:
-            lock_file = self.application.poetry.locker.lock
+            lock_file = self.poetry.locker.lock
         except (RuntimeError, AttributeError):
             return None
         if not lock_file.exists():
             return None
-        with lock_file.open("rb") as f:
-            return hashlib.sha1(f.read()).hexdigest()
+        stat = file_stat(lock_file)
+        self._hashed_lock = (lock_file, stat)
+        if not self._stat_cache:
+            return _file_digest(lock_file, self.hash_algorithm)
+        if digest := self._stat_cache.digest(lock_file, self.hash_algorithm):
+            return digest
+        digest = _file_digest(lock_file, self.hash_algorithm)
+        self._stat_cache.record_digest(lock_file, stat, self.hash_algorithm, digest)
+        return digest
+
+    @cached_property
+    def _stat_cache(self) -> "StatCache | None":
+        """The recorded stat of poetry.lock and the exports, if `stat_cache` is set."""
+        if not self.settings.get("stat_cache"):
+            return None
+        try:
+            lock_file = self.poetry.locker.lock
+        except (RuntimeError, AttributeError):
+            return None
+        return StatCache(lock_file.parent / STATE_FILE)
+
+    @property
+    def hash_algorithm(self) -> str:
+        return self.settings.get("hash_algorithm", DEFAULT_HASH_ALGORITHM)
+
+
+@contextmanager
+def _timed(durations: dict[str, float], phase: str):
+    """Record how many seconds the body of the `with` block took as `durations[phase]`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        durations[phase] = time.perf_counter() - start
+
+
+def _count_packages(content: str) -> int:
+    """Count the requirements in an exported file, skipping comments and options."""
+    if "\n[[packages]]\n" in content:  # pylock.toml
+        return content.count("\n[[packages]]\n")
+    # Requirements are matched in place: a list of all the lines of a large export
+    # with hashes would take several times its size.
+    first = content[:1].isalnum() or content.startswith("-e ")
+    return first + sum(1 for _ in _REQUIREMENT_START.finditer(content))
+
+
+def _file_matches(path: Path, *content: str) -> bool:
+    """Whether a file holds the given pieces of content, reading it in chunks."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            for piece in content:
+                for chunk in chunks.chunks(piece):
+                    if f.read(len(chunk)) != chunk:
+                        return False
+            return f.read(1) == ""
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def _format_diff(out_file: Path, current: str, content: str) -> str:
+    """Format the differences between a file and its export as a unified diff."""
+    import difflib
+
+    from cleo.formatters.formatter import Formatter
+
+    diff = difflib.unified_diff(
+        current.splitlines(keepends=True),
+        content.splitlines(keepends=True),
+        f"{out_file} (current)",
+        f"{out_file} (exported)",
+    )
+    return Formatter.escape("".join(diff))
+
+
+def _hash_label(algorithm: str) -> str:
+    """Label of a hash in the header.
+
+    SHA1 hashes keep the `hash` label they had before other algorithms were
+    supported, so existing checks of the first line keep working.
+    """
+    return "hash" if algorithm == DEFAULT_HASH_ALGORITHM else algorithm
+
+
+def _parse_hash_line(prefix: str, line: str) -> tuple[str | None, str | None]:
+    """Parse a `<prefix><label>: <hex digest>` header line into algorithm and digest."""
+    if not line.startswith(prefix) or ": " not in line:
+        return None, None
+    label, digest = line.removeprefix(prefix).split(": ", 1)
+    algorithm = DEFAULT_HASH_ALGORITHM if label == "hash" else label
+    return algorithm, digest.strip()
+
+
+def _file_digest(path: Path, algorithm: str) -> str:
+    """Hash a file in chunks, without reading all of it into memory."""
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, algorithm).hexdigest()
+        digest = hashlib.new(algorithm)
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        return digest.hexdigest()
@@ -0,0 +1,130 @@
+"""Profile the exports, to tell the time of the plugin from that of poetry.
+
+With the `profile` setting or the `POETRY_AUTO_EXPORT_PROFILE` environment
+variable, each run of the exports is profiled with cProfile. The stats of the
+whole run and of each target are written as pstats files, which can be read with
+`python -m pstats` or visualized with tools like snakeviz or flameprof. A summary
+attributes the time of the run to the plugin, poetry-plugin-export, poetry-core,
+poetry and everything else.
+"""
+
+import cProfile
+import os
+import pstats
+import re
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+ENV_VAR = "POETRY_AUTO_EXPORT_PROFILE"
+DEFAULT_DIRECTORY = ".poetry-auto-export.profiles"
+RUN = "run"
+# The components time is attributed to, by the path of the code, in order.
+COMPONENTS = (
+    ("poetry-auto-export", "/poetry_auto_export/"),
+    ("poetry-plugin-export", "/poetry_plugin_export/"),
+    ("poetry-core", "/poetry/core/"),
+    ("poetry", "/poetry/"),
+)
+
+
+class Profiler:
+    """The profiles of a run of the exports, and of each of its targets.
+
+    Only one profile is active at a time: the run's is paused while a target is
+    profiled, so the targets have to be exported one after the other.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.lock_hash: str | None = None
+        self.profiles: dict[str, cProfile.Profile] = {}
+        self._active: list[cProfile.Profile] = []
+
+    @contextmanager
+    def profile(self, name: str = RUN) -> Iterator[None]:
+        """Profile the `with` block as `name`: the output of a target, or the run."""
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        if self._active:
+            self._active[-1].disable()
+        self._active.append(profile)
+        try:
+            profile.enable()
+        except ValueError:  # Python 3.12+ allows one profiler at a time, across threads
+            pass
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active.pop()
+            if self._active:
+                self._active[-1].enable()
+
+    def save(self) -> tuple[list[Path], dict[str, float]]:
+        """Write the stats of the run, including its targets, and of each target.
+
+        The files are named by the time of the run, the lock hash and the target.
+        Returns the files written and the seconds spent in each component.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        prefix = "-".join(
+            (
+                time.strftime("%Y%m%dT%H%M%S"),
+                (self.lock_hash or "no-lock")[:12],
+                str(os.getpid()),
+            )
+        )
+        paths = []
+        targets = [name for name in self.profiles if name != RUN]
+        run = pstats.Stats(*(self.profiles[name] for name in [RUN, *targets]))
+        for name, stats in [
+            (RUN, run),
+            *((name, pstats.Stats(self.profiles[name])) for name in targets),
+        ]:
+            path = self.directory / f"{prefix}-{_slug(name)}.pstats"
+            stats.dump_stats(path)
+            paths.append(path)
+        return paths, attribute(run)
+
+
+def directory(setting: bool | str, default: Path) -> Path | None:
+    """Where to write the profiles, from the environment variable or the setting."""
+    value = os.environ.get(ENV_VAR, "").strip()
+    if value.lower() in ("", "0", "false", "no"):
+        value = setting  # type: ignore[assignment]
+    elif value.lower() in ("1", "true", "yes"):
+        value = True  # type: ignore[assignment]
+    if value is True:
+        return default
+    if not value:
+        return None
+    return Path(value)
+
+
+def attribute(stats: pstats.Stats) -> dict[str, float]:
+    """Sum the time spent in the code of each component, in seconds.
+
+    Built-in functions, like reading and writing files, count for the component
+    which called them.
+    """
+    totals = dict.fromkeys([name for name, _ in COMPONENTS] + ["other"], 0.0)
+    for (filename, _, _), (_, _, own_time, _, callers) in stats.stats.items():  # type: ignore[attr-defined]
+        if filename == "~" and callers:
+            for (caller_filename, _, _), caller_stats in callers.items():
+                totals[_component(caller_filename)] += caller_stats[2]
+        else:
+            totals[_component(filename)] += own_time
+    return totals
+
+
+def _component(filename: str) -> str:
+    path = filename.replace(os.sep, "/")
+    for name, marker in COMPONENTS:
+        if marker in path:
+            return name
+    return "other"
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")
@@ -0,0 +1,83 @@
+"""Split an export into several files, so they can be installed in stages.
+
+A `native` split puts the packages which ship compiled code in one file and the
+pure-python packages in another, so e.g. a Docker layer with the native packages
+stays cached while the pure-python ones change. `shards` spreads the packages
+over files of roughly equal weight, to install them in parallel.
+
+`poetry.lock` doesn't record the size of distribution files, so the weight of a
+package is the number of files it lists: packages with compiled code list a
+wheel per platform, and are the heavy ones.
+"""
+
+from poetry_auto_export.config import SPLITS, Export
+from poetry_auto_export.incremental import canonicalize_name, entry_name, split_entries
+
+
+def select(body: str, export: Export, lock_data: dict) -> str:
+    """Keep the entries of the part of `export` from the body of the whole export.
+
+    Options, like index URLs, are kept in every part. Other entries which can't
+    be attributed to a locked package, like editable installs, are kept in the
+    first part.
+    """
+    packages = {
+        canonicalize_name(package["name"]): package
+        for package in lock_data.get("package", [])
+    }
+    entries = split_entries(body)
+    if export.split:
+        parts = SPLITS[export.split]
+        assigned = {
+            name: parts[0] if is_native(packages.get(name, {})) else parts[1]
+            for entry in entries
+            if (name := entry_name(entry))
+        }
+    else:
+        parts = tuple(str(shard) for shard in range(1, export.shards + 1))
+        assigned = _balance(
+            {
+                name: weight(packages.get(name, {}))
+                for entry in entries
+                if (name := entry_name(entry))
+            },
+            parts,
+        )
+    kept = []
+    for entry in entries:
+        name = entry_name(entry)
+        if name is not None:
+            part = assigned[name]
+        elif entry.startswith("--"):
+            part = export.part
+        else:
+            part = parts[0]
+        if part == export.part:
+            kept.append(entry)
+    return "".join(entry + "\n" for entry in kept)
+
+
+def is_native(package: dict) -> bool:
+    """Whether a locked package ships compiled code: it has platform specific
+    wheels, or no wheels at all, so it's built when installed."""
+    wheels = [
+        file["file"]
+        for file in package.get("files", [])
+        if file.get("file", "").endswith(".whl")
+    ]
+    return not wheels or any(not wheel.endswith("-none-any.whl") for wheel in wheels)
+
+
+def weight(package: dict) -> int:
+    return max(len(package.get("files", [])), 1)
+
+
+def _balance(weights: dict[str, int], parts: tuple[str, ...]) -> dict[str, str]:
+    """Assign each package to a part, heaviest first, to the lightest part so far."""
+    totals = dict.fromkeys(parts, 0)
+    assigned = {}
+    for name in sorted(weights, key=lambda name: (-weights[name], name)):
+        part = min(parts, key=lambda part: totals[part])
+        assigned[name] = part
+        totals[part] += weights[name]
+    return assigned
@@ -0,0 +1,95 @@
+"""Remember the hashes of files by their stat metadata, to avoid hashing them again.
+
+The state is kept in a sidecar file next to poetry.lock. For poetry.lock, it records
+its size, modification time and inode along with its hashes; for each export, its
+stat along with the lock hash and options hash it's up to date with. As long as the
+stat of a file is the same, it's assumed to be unchanged.
+
+`check_requirements_file.py` reads the same file; keep the format in sync.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from poetry_auto_export import atomic
+
+STATE_FILE = ".poetry-auto-export.json"
+# Files modified this close to when their stat was recorded might have changed
+# again within the resolution of the file system's timestamps, so the recorded
+# stat isn't trusted for them.
+RACY_NS = 2_000_000_000
+
+Stat = list[int]
+
+
+def file_stat(path: Path) -> Stat | None:
+    """The size, modification time and inode of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class StatCache:
+    """The recorded state of poetry.lock and the exports of a project."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            self.files: dict[str, dict] = json.loads(path.read_text(encoding="utf-8"))[
+                "files"
+            ]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.files = {}
+
+    def digest(self, path: Path, algorithm: str) -> str | None:
+        """The recorded hash of a file, if it's unchanged since."""
+        if entry := self._entry(path):
+            return entry.get("hashes", {}).get(algorithm)
+        return None
+
+    def record_digest(self, path: Path, stat: Stat | None, algorithm: str, digest: str):
+        """Record the hash of a file, computed after taking its `stat`."""
+        if stat:
+            hashes = {}
+            if entry := self._entry(path):
+                hashes = entry.get("hashes", {})
+            self._record(path, stat, hashes={**hashes, algorithm: digest})
+
+    def is_exported(self, path: Path, lock_hash: str, options_hash: str) -> bool:
+        """Whether an export is unchanged since it was up to date with the lock and options."""
+        entry = self._entry(path)
+        return bool(
+            entry
+            and entry.get("lock_hash") == lock_hash
+            and entry.get("options_hash") == options_hash
+        )
+
+    def record_export(self, path: Path, lock_hash: str, options_hash: str):
+        if stat := file_stat(path):
+            self._record(path, stat, lock_hash=lock_hash, options_hash=options_hash)
+
+    def save(self):
+        """Write the state atomically, ignoring failures: it's only an optimization."""
+        try:
+            atomic.write(
+                self.path, json.dumps({"files": self.files}, indent=1, sort_keys=True)
+            )
+        except OSError:
+            pass
+
+    def _entry(self, path: Path) -> dict | None:
+        entry = self.files.get(os.path.abspath(path))
+        if not isinstance(entry, dict) or entry.get("stat") != file_stat(path):
+            return None
+        if entry["stat"][1] + RACY_NS >= entry.get("recorded_at", 0):
+            return None
+        return entry
+
+    def _record(self, path: Path, stat: Stat, **values):
+        self.files[os.path.abspath(path)] = dict(
+            stat=stat, recorded_at=time.time_ns(), **values
+        )
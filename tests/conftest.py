@@ -9,9 +9,19 @@ from cleo.events.event_dispatcher import EventDispatcher
 from cleo.io.inputs.string_input import StringInput
 from cleo.io.io import IO
 from cleo.io.outputs.output import Output
+from poetry.console.commands.lock import LockCommand
 from pytest_mock import MockerFixture
 
-from poetry_auto_export.plugin import LockCommand, PoetryAutoExport
+from poetry_auto_export.config import Export
+from poetry_auto_export.plugin import PoetryAutoExport
+
+
+@pytest.fixture(autouse=True)
+def poetry_cache_dir(tmp_path_factory, monkeypatch) -> Path:
+    """Keep what the plugin writes to Poetry's cache directory, like its locks, out of the user's."""
+    cache_dir = tmp_path_factory.mktemp("poetry-cache")
+    monkeypatch.setenv("POETRY_CACHE_DIR", str(cache_dir))
+    return cache_dir
 
 
 @pytest.fixture
@@ -29,10 +39,23 @@ def event(io: IO, mocker: MockerFixture) -> Event:
 @pytest.fixture
 def plugin() -> PoetryAutoExport:
     p = PoetryAutoExport()
-    p.configs = [{"output": "requirements.txt"}]
+    p.configs = [Export.from_config({"output": "requirements.txt"})]
+    p.settings = {}
     return p
 
 
+@pytest.fixture
+def engine(mocker: MockerFixture, cwd_without_pyproject: Path):
+    """Replace the export engine, so that tests don't need a real poetry project.
+
+    The exports are still written, to a temporary working directory.
+    """
+    engine = mocker.Mock()
+    engine.render.return_value = "Placeholder value\n"
+    mocker.patch.object(PoetryAutoExport, "_create_engine", return_value=engine)
+    return engine
+
+
 @pytest.fixture
 def io():
     return IO(input=StringInput(""), output=Output(), error_output=Output())
@@ -58,3 +81,11 @@ def basic_project(cwd_without_pyproject):
     for file in (FIXTURES_DIR / "basic_project").glob("*"):
         shutil.copy(file, cwd_without_pyproject)
     yield cwd_without_pyproject
+
+
+@pytest.fixture
+def grouped_project(cwd_without_pyproject):
+    """A project with a `dev` dependency group, locked with groups and markers."""
+    for file in (FIXTURES_DIR / "grouped_project").glob("*"):
+        shutil.copy(file, cwd_without_pyproject)
+    yield cwd_without_pyproject
@@ -0,0 +1,42 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from poetry_auto_export import atomic
+
+
+def test_write_keeps_mode(tmp_path: Path):
+    path = tmp_path / "requirements.txt"
+    path.write_text("old\n")
+    path.chmod(0o640)
+
+    atomic.write(path, "header\n", "body\n", keep_mode=True)
+
+    assert path.read_text() == "header\nbody\n"
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_write_from_threads(tmp_path: Path):
+    path = tmp_path / "state.json"
+    threads = [
+        threading.Thread(target=atomic.write, args=(path, str(i) * 100_000))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(path.read_text())) == 1
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_write_failure_removes_temp_file(tmp_path: Path):
+    path = tmp_path / "requirements.txt"
+
+    with pytest.raises(UnicodeEncodeError):
+        atomic.write(path, "\udc80")
+
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,94 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+from poetry.console.application import Application
+from pytest_mock import MockerFixture
+
+from poetry_auto_export import background
+from poetry_auto_export.locks import SUPPORTED, FileLock
+from poetry_auto_export.plugin import PoetryAutoExport
+from tests.test_check_requirements_file import script_path
+from tests.test_commands import command_tester
+
+pytestmark = pytest.mark.skipif(not SUPPORTED, reason="needs POSIX file locks")
+
+
+def test_background_export(basic_project: Path, event, dispatcher):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"background": True}
+
+    plugin.run_exports(event, "", dispatcher)
+
+    status = background.wait(basic_project, timeout=60)
+    assert status["exit_code"] == 0, status["output"]
+    assert "Exporting dependencies to requirements.txt" in status["output"]
+    assert (basic_project / "requirements.txt").exists()
+    args = ["python", script_path, "--wait"]
+    assert subprocess.call(args, cwd=basic_project) == 0
+
+
+def test_requests_are_coalesced(tmp_path: Path, mocker: MockerFixture):
+    popen = mocker.patch("subprocess.Popen")
+    export = mocker.patch.object(background, "_export", return_value=(0, "done"))
+    worker_lock = FileLock(tmp_path / background.LOCK_FILE)
+    worker_lock.acquire()
+
+    # A worker is running, so the requests are left to it
+    background.start(tmp_path, tmp_path)
+    background.start(tmp_path, tmp_path)
+    assert popen.call_count == 0
+
+    background.run(tmp_path, tmp_path, worker_lock)
+
+    assert export.call_count == 1
+    assert background.read_status(tmp_path) == {
+        "generation": background.requested(tmp_path),
+        "exit_code": 0,
+        "output": "done",
+    }
+    assert background.wait(tmp_path, timeout=1)["output"] == "done"
+
+
+def test_start_hands_the_lock_to_the_worker(tmp_path: Path, mocker: MockerFixture):
+    popen = mocker.patch("subprocess.Popen")
+
+    background.start(tmp_path, tmp_path)
+
+    (args,), kwargs = popen.call_args
+    assert args[-1] == str(kwargs["pass_fds"][0])
+    assert kwargs["start_new_session"]
+    assert background.is_pending(tmp_path)
+
+
+def test_wait_for_a_stopped_worker(tmp_path: Path, mocker: MockerFixture):
+    mocker.patch("subprocess.Popen")
+    background.start(tmp_path, tmp_path)
+
+    with pytest.raises(RuntimeError, match="isn't running"):
+        background.wait(tmp_path, timeout=10)
+
+    # Waiting for a worker which is still running times out
+    worker_lock = FileLock(tmp_path / background.LOCK_FILE)
+    worker_lock.acquire()
+    with pytest.raises(TimeoutError):
+        background.wait(tmp_path, timeout=0.1)
+    worker_lock.release()
+
+
+def test_wait_command(basic_project: Path, mocker: MockerFixture):
+    mocker.patch.object(background, "_export", return_value=(1, "Failed\n"))
+    mocker.patch("subprocess.Popen")
+    tester = command_tester("auto-export wait")
+
+    assert tester.execute() == 0
+    assert "No exports ran in the background" in tester.io.fetch_output()
+
+    background.start(basic_project, basic_project)
+    lock = FileLock(basic_project / background.LOCK_FILE)
+    lock.acquire()
+    background.run(basic_project, basic_project, lock)
+
+    assert tester.execute() == 1
+    assert tester.io.fetch_output() == "Failed\n"
@@ -0,0 +1,112 @@
+import os
+from pathlib import Path
+
+import pytest
+from cleo.io.null_io import NullIO
+from poetry.console.application import Application
+from pytest_mock import MockerFixture
+from tomlkit.container import Container
+
+from poetry_auto_export import chunks
+from poetry_auto_export.cache import ExportCache
+from poetry_auto_export.config import Export
+from poetry_auto_export.exporter import ExportEngine
+from poetry_auto_export.plugin import PoetryAutoExport
+
+
+def test_cache_round_trip(tmp_path: Path):
+    cache = ExportCache(tmp_path, max_size=1 << 20)
+    key = ExportCache.key(lock_hash="abc", options_hash="def")
+
+    assert cache.get(key) is None
+    cache.put(key, "requests==2.32.3\n")
+
+    assert cache.get(key) == "requests==2.32.3\n"
+    assert ExportCache.key(lock_hash="abc", options_hash="xyz") != key
+
+
+def test_cache_stores_pieces_in_chunks(tmp_path: Path, mocker: MockerFixture):
+    mocker.patch.object(chunks, "CHUNK_SIZE", 4)
+    write = mocker.spy(chunks, "write")
+    cache = ExportCache(tmp_path, max_size=1 << 20)
+
+    cache.put("abc", "# poetry.lock hash: abc\n", "requests==2.32.3\n")
+
+    assert write.call_count == 1
+    assert cache.get("abc") == "# poetry.lock hash: abc\nrequests==2.32.3\n"
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = ExportCache(tmp_path, max_size=25)
+    cache.put("aa1", "x" * 10)
+    cache.put("bb2", "y" * 10)
+    os.utime(tmp_path / "aa" / "aa1", ns=(1, 1))
+    os.utime(tmp_path / "bb" / "bb2", ns=(2, 2))
+
+    cache.put("cc3", "z" * 10)
+
+    assert cache.get("aa1") is None
+    assert cache.get("bb2") == "y" * 10
+    assert cache.get("cc3") == "z" * 10
+
+
+def test_export_from_cache(
+    basic_project: Path, tmp_path: Path, event, dispatcher, mocker: MockerFixture
+):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"cache": str(tmp_path / "cache"), "report": "report.json"}
+    plugin.run_exports(event, "", dispatcher)
+    requirements = basic_project / "requirements.txt"
+    exported = requirements.read_text()
+
+    # e.g. after checking out another branch with the same poetry.lock
+    requirements.unlink()
+    render = mocker.spy(ExportEngine, "render")
+    plugin.run_exports(event, "", dispatcher)
+
+    assert render.call_count == 0
+    assert requirements.read_text() == exported
+    assert '"status": "cached"' in Path("report.json").read_text()
+
+
+@pytest.mark.parametrize(
+    "dependency", ["poetry", "poetry-core", "poetry-plugin-export"]
+)
+def test_cache_key_depends_on_versions(
+    basic_project: Path, tmp_path: Path, mocker: MockerFixture, dependency: str
+):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"cache": str(tmp_path / "cache")}
+    engine = ExportEngine(plugin.poetry, NullIO())
+    export = plugin.configs[0]
+    version = mocker.patch("importlib.metadata.version", return_value="1.0.0")
+    key = plugin._cache_key(engine, export, "abc", "def")
+
+    version.side_effect = lambda name: "2.0.0" if name == dependency else "1.0.0"
+
+    assert plugin._cache_key(engine, export, "abc", "def") != key
+
+
+def test_exports_with_credentials_are_not_cached(
+    basic_project: Path, tmp_path: Path, event, dispatcher
+):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.configs = [
+        Export.from_config({"output": "requirements.txt", "with_credentials": True})
+    ]
+    plugin.settings = {"cache": str(tmp_path / "cache")}
+
+    plugin.run_exports(event, "", dispatcher)
+
+    assert not (tmp_path / "cache").exists()
+
+
+@pytest.mark.parametrize("settings", [{"cache": 1}, {"cache_size_mb": 0}])
+def test_invalid_cache_settings(plugin: PoetryAutoExport, settings: dict):
+    container = Container()
+    container.update({"tool": {"poetry-auto-export": settings}})
+    with pytest.raises(ValueError):
+        plugin._parse_settings(container)
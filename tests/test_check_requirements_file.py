@@ -1,11 +1,18 @@
+import hashlib
+import json
+import shutil
 import subprocess
+import sys
+from dataclasses import fields
 from pathlib import Path
 
 import pytest
 from poetry.console.application import Application
-from pytest_mock import MockerFixture
+from poetry.console.commands.lock import LockCommand
 
-from poetry_auto_export.plugin import LockCommand, PoetryAutoExport
+from poetry_auto_export import check_requirements_file
+from poetry_auto_export.config import ALIASES, SPLITS, Export
+from poetry_auto_export.plugin import PoetryAutoExport
 
 repo_root = Path(__file__).parent.parent
 script_path = (repo_root / "poetry_auto_export/check_requirements_file.py").absolute()
@@ -13,11 +20,10 @@ script_path = (repo_root / "poetry_auto_export/check_requirements_file.py").abso
 
 @pytest.fixture
 def valid_project(
-    mocker: MockerFixture,
+    engine,
     basic_project: Path,
     event,
     dispatcher,
-    plugin: PoetryAutoExport,
 ) -> Path:
     """
     A poetry project with up-to-date generated requirements.txt file.
@@ -25,9 +31,9 @@ def valid_project(
     """
     application = Application()
     event._command = LockCommand()
-    event.command.call = mocker.Mock()
     (basic_project / "requirements.txt").write_text("Placeholder value")
     # When
+    plugin = PoetryAutoExport()
     plugin.activate(application)
     plugin.run_exports(event, "", dispatcher)
     return basic_project
@@ -85,3 +91,387 @@ def test_script_outdated_requirements(valid_project: Path):
     assert result.returncode == 1
     assert "requirements.txt is out of date" in result.stderr.decode()
     assert "poetry-auto-export" in result.stderr.decode()
+
+
+@pytest.mark.parametrize("algorithm", ["sha256", "blake2b"])
+def test_script_pass_with_algorithm(
+    engine,
+    basic_project: Path,
+    event,
+    dispatcher,
+    algorithm: str,
+):
+    """Requirements files hashed with another algorithm are checked with that algorithm."""
+    event._command = LockCommand()
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"hash_algorithm": algorithm}
+    plugin.run_exports(event, "", dispatcher)
+
+    first_line = (basic_project / "requirements.txt").read_text().split("\n")[0]
+    assert first_line.startswith(f"# poetry.lock {algorithm}: ")
+    assert subprocess.call(["python", script_path], cwd=basic_project) == 0
+
+    lock_file = basic_project / "poetry.lock"
+    lock_file.write_text(lock_file.read_text() + " ")
+    assert subprocess.call(["python", script_path], cwd=basic_project) == 1
+
+
+def test_script_rejects_unknown_algorithm(valid_project: Path):
+    """A header with an unsupported algorithm label is out of date, not a pass."""
+    requirements = valid_project / "requirements.txt"
+    lines = requirements.read_text().split("\n")
+    lines[0] = lines[0].replace("# poetry.lock hash:", "# poetry.lock md5:")
+    requirements.write_text("\n".join(lines))
+
+    result = subprocess.run(
+        ["python", script_path], cwd=valid_project, capture_output=True
+    )
+
+    assert result.returncode == 1
+    assert "requirements.txt is out of date" in result.stderr.decode()
+
+
+@pytest.fixture
+def content_fingerprint_project(grouped_project: Path, event, dispatcher) -> Path:
+    """A project exported with a content fingerprint, excluding the dev group."""
+    pyproject = grouped_project / "pyproject.toml"
+    pyproject.write_text(pyproject.read_text() + 'fingerprint = "content"\n')
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.run_exports(event, "", dispatcher)
+    return grouped_project
+
+
+def test_script_content_fingerprint_pass(content_fingerprint_project: Path):
+    """Changes to packages which aren't exported don't make the file outdated."""
+    lock_file = content_fingerprint_project / "poetry.lock"
+    lock_file.write_text(lock_file.read_text().replace("2024.6.2", "2024.7.4"))
+
+    exit_code = subprocess.call(
+        ["python", script_path], cwd=content_fingerprint_project
+    )
+
+    assert exit_code == 0
+
+
+@pytest.mark.parametrize(
+    "file_name, old, new",
+    [
+        ("poetry.lock", 'version = "3.7"', 'version = "3.8"'),
+        ("poetry.lock", "sha256:82fee1", "sha256:00fee1"),
+        ("requirements.txt", "idna==3.7", "idna==3.6"),
+    ],
+)
+def test_script_content_fingerprint_outdated(
+    content_fingerprint_project: Path, file_name: str, old: str, new: str
+):
+    """Changes to exported packages or edits by hand make the file outdated."""
+    path = content_fingerprint_project / file_name
+    path.write_text(path.read_text().replace(old, new))
+
+    result = subprocess.run(
+        ["python", script_path], cwd=content_fingerprint_project, capture_output=True
+    )
+
+    assert result.returncode == 1
+    assert "requirements.txt is out of date" in result.stderr.decode()
+
+
+@pytest.fixture
+def monorepo(tmp_path: Path, plugin: PoetryAutoExport) -> Path:
+    """Three projects with up-to-date exports, found by the batch options."""
+    plugin.settings = {}
+    for name in ("api", "worker", "web"):
+        project = tmp_path / name
+        project.mkdir()
+        shutil.copy(repo_root / "tests/fixtures/basic_project/poetry.lock", project)
+        (project / "pyproject.toml").write_text(
+            "[tool.poetry-auto-export]\n"
+            'output = "requirements.txt"\n'
+            "[[tool.poetry-auto-export.exports]]\n"
+            'output = "requirements-dev.txt"\n'
+        )
+        lock_hash = hashlib.sha1((project / "poetry.lock").read_bytes()).hexdigest()
+        for output in ("requirements.txt", "requirements-dev.txt"):
+            options_hash = plugin._compute_options_hash(
+                Export.from_config({"output": output})
+            )
+            (project / output).write_text(
+                plugin._format_header(lock_hash, options_hash)
+            )
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--glob", "*/requirements*.txt"],
+        ["--discover", "."],
+        ["--manifest", "manifest.txt"],
+    ],
+)
+def test_script_batch_pass(monorepo: Path, args: list[str]):
+    (monorepo / "manifest.txt").write_text(
+        "# lock file, requirements file\n"
+        "api/poetry.lock api/requirements.txt\n"
+        "web/poetry.lock web/requirements-dev.txt\n"
+    )
+
+    result = subprocess.run(
+        ["python", script_path, *args], cwd=monorepo, capture_output=True
+    )
+
+    assert result.returncode == 0, result.stderr.decode()
+    assert "up to date" in result.stdout.decode()
+
+
+def test_script_batch_reports_every_outdated_file(monorepo: Path):
+    (monorepo / "worker/poetry.lock").write_text("changed")
+    (monorepo / "web/requirements.txt").write_text("# edited by hand\n")
+
+    result = subprocess.run(
+        ["python", script_path, "--discover", "."], cwd=monorepo, capture_output=True
+    )
+
+    assert result.returncode == 1
+    stale = [line.split(":")[0] for line in result.stderr.decode().splitlines()]
+    assert sorted(stale[:-1]) == [
+        "web/requirements.txt",
+        "worker/requirements-dev.txt",
+        "worker/requirements.txt",
+    ]
+    assert "3 requirements file(s) out of date" in stale[-1]
+
+
+def test_discover_without_tomllib(monorepo: Path, monkeypatch):
+    monkeypatch.setattr(check_requirements_file, "load_toml", lambda: None)
+    monkeypatch.setattr(check_requirements_file, "_export_sections", {})
+
+    pairs = check_requirements_file.pairs_from_pyprojects(str(monorepo))
+    assert len(pairs) == 6
+
+    (monorepo / "web/pyproject.toml").write_text(
+        '[tool.poetry-auto-export]\nexports = [{ output = "requirements.txt" }]\n'
+    )
+    monkeypatch.setattr(check_requirements_file, "_export_sections", {})
+    with pytest.raises(check_requirements_file.UsageError, match="tomli"):
+        check_requirements_file.pairs_from_pyprojects(str(monorepo))
+
+
+def test_script_batch_nothing_found(tmp_path: Path):
+    result = subprocess.run(
+        ["python", script_path, "--glob", "*.txt"], cwd=tmp_path, capture_output=True
+    )
+
+    assert result.returncode == 1
+    assert "No requirements files found" in result.stderr.decode()
+
+
+def test_script_changed_options(valid_project: Path):
+    """Changing the export options without exporting again makes the file outdated."""
+    pyproject = valid_project / "pyproject.toml"
+    pyproject.write_text(pyproject.read_text().replace("without_hashes = true\n", ""))
+
+    result = subprocess.run(
+        ["python", script_path], cwd=valid_project, capture_output=True
+    )
+
+    assert result.returncode == 1
+    assert "its export options have changed" in result.stderr.decode()
+
+
+def test_script_batch_changed_options(monorepo: Path):
+    pyproject = monorepo / "worker/pyproject.toml"
+    pyproject.write_text(
+        pyproject.read_text().replace(
+            'output = "requirements-dev.txt"\n',
+            'output = "requirements-dev.txt"\nwith = ["dev"]\n',
+        )
+    )
+
+    result = subprocess.run(
+        ["python", script_path, "--discover", "."], cwd=monorepo, capture_output=True
+    )
+
+    assert result.returncode == 1
+    assert result.stderr.decode().splitlines()[0] == (
+        "worker/requirements-dev.txt: out of date with its export options"
+    )
+
+
+def test_script_discovers_split_parts(engine, basic_project: Path, event, dispatcher):
+    pyproject = basic_project / "pyproject.toml"
+    pyproject.write_text(pyproject.read_text() + "shards = 2\n")
+    engine.lock_data = {"package": []}
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.run_exports(event, "", dispatcher)
+
+    result = subprocess.run(
+        ["python", script_path, "--discover", "."],
+        cwd=basic_project,
+        capture_output=True,
+    )
+
+    assert result.returncode == 0, result.stderr.decode()
+    assert "2 requirements file(s) up to date" in result.stdout.decode()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [["poetry.lock", "requirements.txt", "extra"], ["--glob"], ["--unknown", "x"]],
+)
+def test_script_usage_errors(valid_project: Path, args: list[str]):
+    """Invalid arguments exit with 2, without a traceback."""
+    result = subprocess.run(
+        ["python", script_path, *args], cwd=valid_project, capture_output=True
+    )
+
+    assert result.returncode == 2
+    assert "see --help for usage" in result.stderr.decode()
+    assert "Traceback" not in result.stderr.decode()
+
+
+def test_main_returns_exit_code(valid_project: Path, monkeypatch, capsys):
+    """The `poetry-auto-export-check` entry point returns the exit code."""
+    monkeypatch.chdir(valid_project)
+
+    assert check_requirements_file.main([]) == 0
+    assert check_requirements_file.main(["poetry.lock", "missing.txt"]) == 1
+    assert "File not found" in capsys.readouterr().err
+
+
+def test_script_imports(valid_project: Path):
+    """The checker starts with as few imports as possible, and none of poetry's."""
+    result = subprocess.run(
+        ["python", "-S", "-I", "-X", "importtime", script_path],
+        cwd=valid_project,
+        capture_output=True,
+    )
+
+    assert result.returncode == 0
+    imported = {
+        line.split("|")[-1].strip() for line in result.stderr.decode().splitlines()
+    }
+    assert not imported & {"pathlib", "tomllib", "json", "re", "concurrent.futures"}
+
+    code = "import sys, poetry_auto_export.check_requirements_file; print(sorted(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=repo_root, capture_output=True, check=True
+    )
+    assert "cleo" not in result.stdout.decode()
+
+
+def test_export_options_match_config():
+    """The options the checker hashes are those of `Export`, with the same defaults."""
+    expected = {
+        ALIASES.get(field.name, field.name): (
+            list(field.default) if isinstance(field.default, tuple) else field.default
+        )
+        for field in fields(Export)
+        if field.name not in ("output", "unknown", "part")
+    }
+
+    assert check_requirements_file.EXPORT_OPTIONS == expected
+    assert check_requirements_file.SPLITS == SPLITS
+
+
+PYPROJECTS = [
+    """[tool.poetry]
+name = "project"
+
+[tool.poetry-auto-export]
+output = "requirements.txt"  # the default target
+without_hashes = true
+with = ["dev", 'test']
+shards = 3
+""",
+    """[tool.poetry-auto-export]
+[[tool.poetry-auto-export.exports]]
+output = "requirements.txt"
+extras = [
+    "socks",  # for proxies
+    "security",
+]
+
+[[tool.poetry-auto-export.exports]]
+output = "constraints.txt"
+format = "constraints.txt"
+
+[tool.ruff]
+line-length = 88
+""",
+    """[tool.poetry-auto-export]
+output = 'requirements.txt'
+fingerprint = 'content' # a comment after a single-quoted string
+stat_cache = true
+
+[[tool.poetry-auto-export.exports]]
+# a comment before the first key
+output = "requirements-dev.txt"
+without_hashes = false
+incremental = true
+with = [
+    'dev',
+    "test", # the tests
+    'docs'
+]
+
+[[tool.poetry-auto-export.exports]]
+output = "requirements#shards.txt"
+shards = 12
+only = []
+split = "native"
+""",
+]
+
+
+@pytest.mark.parametrize("content", PYPROJECTS)
+def test_read_export_sections(tmp_path: Path, content: str):
+    """The line-based reader agrees with tomllib on the usual layouts."""
+    tomllib = pytest.importorskip("tomllib")
+    pyproject = tmp_path / "pyproject.toml"
+    pyproject.write_text(content)
+    config = tomllib.loads(content)["tool"]["poetry-auto-export"]
+
+    assert check_requirements_file.read_export_sections(str(pyproject)) == (
+        check_requirements_file._export_sections_of(
+            [config, *config.get("exports", [])]
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {},
+        [],
+        {"with": ["dev", "test"], "without_hashes": True, "shards": 3},
+        {"format": None, "incremental": False, "part": "native", "shards": 0},
+        {"output": 'say "hi"', "path": "C:\\deps", "name": "réquirements"},
+        {"tab": "a\tb", "nested": {"b": [1, [True, None]], "a": {}}},
+        ["z", "a", -1, 10**20],
+    ],
+)
+def test_dump_json(value):
+    """The serializer of the options agrees with json."""
+    expected = json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+    assert check_requirements_file.dump_json(value) == expected
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        '[tool.poetry-auto-export]\nexports = [{ output = "requirements.txt" }]\n',
+        '[tool]\npoetry-auto-export.output = "requirements.txt"\n',
+        '[tool.poetry-auto-export]\noutput = "requirements\\u002etxt"\n',
+    ],
+)
+def test_read_export_sections_falls_back(tmp_path: Path, content: str):
+    """Layouts the line-based reader doesn't understand are left to a TOML parser."""
+    pyproject = tmp_path / "pyproject.toml"
+    pyproject.write_text(content)
+
+    assert check_requirements_file.read_export_sections(str(pyproject)) is None
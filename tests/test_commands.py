@@ -0,0 +1,209 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from cleo.testers.command_tester import CommandTester
+from poetry.console.application import Application
+from pytest_mock import MockerFixture
+
+from poetry_auto_export import commands
+from poetry_auto_export.plugin import PoetryAutoExport
+from tests.conftest import FIXTURES_DIR
+
+
+def command_tester(name: str) -> CommandTester:
+    application = Application()
+    PoetryAutoExport().activate(application)
+    return CommandTester(application.find(name))
+
+
+def sleeps(mocker: MockerFixture, *actions):
+    """Replace `time.sleep` by the given actions, then stop the command."""
+    actions_left = list(actions)
+
+    def sleep(seconds: float):
+        if not actions_left:
+            raise KeyboardInterrupt
+        actions_left.pop(0)()
+
+    mocker.patch("time.sleep", side_effect=sleep)
+
+
+def test_watch_debounces_changes(tmp_path: Path, mocker: MockerFixture):
+    lock_file, pyproject_file = tmp_path / "poetry.lock", tmp_path / "pyproject.toml"
+    lock_file.write_text("old")
+    pyproject_file.write_text("old")
+    sleeps(
+        mocker,
+        lambda: lock_file.write_text("new"),
+        lambda: pyproject_file.write_text("new"),
+        lambda: None,
+    )
+
+    changes = commands.watch([lock_file, pyproject_file], 0.5, 0.2)
+
+    assert next(changes) == {lock_file, pyproject_file}
+    with pytest.raises(KeyboardInterrupt):
+        next(changes)
+
+
+def test_watch_exports_on_lock_change(grouped_project: Path, mocker: MockerFixture):
+    lock_file = grouped_project / "poetry.lock"
+    requirements = grouped_project / "requirements.txt"
+    sleeps(
+        mocker,
+        lambda: lock_file.write_text(
+            lock_file.read_text().replace('version = "3.7"', 'version = "3.8"')
+        ),
+        lambda: None,
+    )
+
+    tester = command_tester("auto-export watch")
+    assert tester.execute() == 0
+
+    assert "idna==3.8" in requirements.read_text()
+    assert tester.io.fetch_output().count("Exporting dependencies to") == 2
+
+
+def test_watch_survives_invalid_pyproject(grouped_project: Path, mocker: MockerFixture):
+    lock_file = grouped_project / "poetry.lock"
+    pyproject_file = grouped_project / "pyproject.toml"
+    pyproject = pyproject_file.read_text()
+
+    def fix():
+        pyproject_file.write_text(pyproject)
+        lock_file.write_text(
+            lock_file.read_text().replace('version = "3.7"', 'version = "3.8"')
+        )
+
+    sleeps(
+        mocker,
+        lambda: pyproject_file.write_text(
+            pyproject.replace('name = "grouped-app"', "name = 12")
+        ),
+        lambda: None,
+        fix,
+        lambda: None,
+    )
+
+    tester = command_tester("auto-export watch")
+    assert tester.execute() == 0
+
+    assert "Failed to export" in tester.io.fetch_error()
+    assert "idna==3.8" in (grouped_project / "requirements.txt").read_text()
+
+
+def test_watch_reads_settings_again(grouped_project: Path, mocker: MockerFixture):
+    pyproject_file = grouped_project / "pyproject.toml"
+    sleeps(
+        mocker,
+        lambda: pyproject_file.write_text(
+            pyproject_file.read_text().replace(
+                "[tool.poetry-auto-export]\n",
+                "[tool.poetry-auto-export]\nstat_cache = true\n",
+            )
+        ),
+        lambda: None,
+    )
+
+    assert command_tester("auto-export watch").execute() == 0
+
+    assert (grouped_project / ".poetry-auto-export.json").exists()
+
+
+@pytest.fixture
+def workspace(cwd_without_pyproject: Path) -> Path:
+    """Two projects configured for export, and one which isn't."""
+    for name in ("basic_project", "grouped_project"):
+        shutil.copytree(FIXTURES_DIR / name, cwd_without_pyproject / "apps" / name)
+    (cwd_without_pyproject / "libs" / "unconfigured").mkdir(parents=True)
+    (cwd_without_pyproject / "libs" / "unconfigured" / "pyproject.toml").write_text(
+        '[tool.poetry]\nname = "unconfigured"\n'
+    )
+    return cwd_without_pyproject
+
+
+def test_find_projects(workspace: Path):
+    assert commands.find_projects(workspace) == [
+        workspace / "apps" / "basic_project",
+        workspace / "apps" / "grouped_project",
+    ]
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_export_all(workspace: Path, jobs: str):
+    tester = command_tester("auto-export all")
+
+    assert tester.execute(f"apps --jobs {jobs}") == 0
+
+    basic = workspace / "apps" / "basic_project" / "requirements.txt"
+    grouped = workspace / "apps" / "grouped_project" / "requirements.txt"
+    assert "requests==2.32.3" in basic.read_text()
+    assert "idna==3.7" in grouped.read_text()
+    assert not (workspace / "requirements.txt").exists()
+    output = tester.io.fetch_output()
+    assert output.index("basic_project") < output.index("grouped_project")
+
+    # Exports which are up to date are skipped on the next run
+    tester.execute("apps")
+    assert tester.io.fetch_output().count("Skipping export to") == 2
+
+
+def test_export_all_shares_one_pool(workspace: Path, mocker: MockerFixture):
+    pyproject = workspace / "apps" / "basic_project" / "pyproject.toml"
+    pyproject.write_text(
+        pyproject.read_text().replace(
+            "[tool.poetry-auto-export]\n", "[tool.poetry-auto-export]\njobs = 4\n"
+        )
+    )
+    map_targets = mocker.spy(PoetryAutoExport, "_map_targets")
+
+    assert command_tester("auto-export all").execute("apps --jobs 2") == 0
+
+    assert map_targets.call_count == 2
+    assert all(
+        call.args[0].settings["jobs"] == 1 for call in map_targets.call_args_list
+    )
+
+
+def test_auto_export(basic_project: Path):
+    tester = command_tester("auto-export")
+
+    assert tester.execute() == 0
+
+    assert "requests==2.32.3" in (basic_project / "requirements.txt").read_text()
+
+
+def test_check_does_not_write(basic_project: Path):
+    pyproject = basic_project / "pyproject.toml"
+    pyproject.write_text(
+        pyproject.read_text().replace(
+            "[tool.poetry-auto-export]\n",
+            '[tool.poetry-auto-export]\ncache = ".cache/auto-export"\n',
+        )
+    )
+    tester = command_tester("auto-export")
+
+    assert tester.execute("--check") == 1
+
+    assert "Missing: requirements.txt" in tester.io.fetch_error()
+    assert not (basic_project / "requirements.txt").exists()
+    assert not (basic_project / ".cache").exists()
+
+
+def test_check_compares_full_content(basic_project: Path):
+    tester = command_tester("auto-export")
+    tester.execute()
+    requirements = basic_project / "requirements.txt"
+    assert tester.execute("--check") == 0
+
+    # An edit which leaves the header alone
+    requirements.write_text(
+        requirements.read_text().replace("requests==", "requests>=")
+    )
+
+    assert tester.execute("--diff") == 1
+    output = tester.io.fetch_output()
+    assert "-requests>=2.32.3" in output
+    assert "+requests==2.32.3" in output
+    assert "requests>=" in requirements.read_text()
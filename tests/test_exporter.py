@@ -0,0 +1,251 @@
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+import tomlkit
+from cleo.io.null_io import NullIO
+from poetry.console.application import Application
+from poetry.packages.locker import Locker
+from poetry.repositories.repository_pool import RepositoryPool
+from poetry_plugin_export.exporter import Exporter
+from pytest_mock import MockerFixture
+
+from poetry_auto_export.config import Export
+from poetry_auto_export.exporter import ExportEngine
+from poetry_auto_export.plugin import PoetryAutoExport
+from tests.test_check_requirements_file import script_path
+
+requires_pylock = pytest.mark.skipif(
+    not Exporter.is_format_supported("pylock.toml"),
+    reason="pylock.toml requires poetry-plugin-export 1.10+",
+)
+
+
+@pytest.fixture
+def export_engine(basic_project: Path) -> ExportEngine:
+    return ExportEngine(Application().poetry, NullIO())
+
+
+def test_render_requirements(export_engine: ExportEngine):
+    requirements = export_engine.render(
+        Export.from_config({"output": "requirements.txt", "without_hashes": True})
+    )
+
+    assert "requests==2.32.3" in requirements
+    assert "--hash" not in requirements
+
+
+def test_render_with_hashes(export_engine: ExportEngine):
+    requirements = export_engine.render(
+        Export.from_config({"output": "requirements.txt"})
+    )
+
+    assert "requests==2.32.3" in requirements
+    assert "--hash=sha256:" in requirements
+
+
+def test_render_does_not_write(basic_project: Path, export_engine: ExportEngine):
+    export_engine.render(Export.from_config({"output": "requirements.txt"}))
+
+    assert not (basic_project / "requirements.txt").exists()
+
+
+def test_lock_file_loaded_once(mocker: MockerFixture, export_engine: ExportEngine):
+    spy = mocker.spy(Locker, "locked_repository")
+
+    export_engine.render(Export.from_config({"output": "requirements.txt"}))
+    export_engine.render(
+        Export.from_config(
+            {"output": "requirements-no-hashes.txt", "without_hashes": True}
+        )
+    )
+
+    assert spy.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "export",
+    [
+        {"output": "requirements.txt", "format": "invalid"},
+        {"output": "requirements.txt", "with": ["missing"]},
+        {"output": "requirements.txt", "extras": ["missing"]},
+        {"output": "requirements.txt", "extras": ["missing"], "all_extras": True},
+    ],
+)
+def test_invalid_export_options(export: dict, export_engine: ExportEngine):
+    with pytest.raises(ValueError):
+        export_engine.render(Export.from_config(export))
+
+
+@pytest.mark.parametrize(
+    "export, expected, unexpected",
+    [
+        ({"without": ["dev"]}, ["idna==3.7"], ["certifi"]),
+        ({"with": ["dev"]}, ["idna==3.7", "certifi==2024.6.2"], []),
+        ({"only": ["dev"]}, ["certifi==2024.6.2"], ["idna"]),
+        ({"with": ["dev,dev"]}, ["idna==3.7", "certifi==2024.6.2"], []),
+        ({"only": ["main, dev"]}, ["idna==3.7", "certifi==2024.6.2"], []),
+    ],
+)
+def test_render_groups(
+    grouped_project: Path, export: dict, expected: list[str], unexpected: list[str]
+):
+    engine = ExportEngine(Application().poetry, NullIO())
+
+    requirements = engine.render(
+        Export.from_config({"output": "requirements.txt", **export})
+    )
+
+    for requirement in expected:
+        assert requirement in requirements
+    for requirement in unexpected:
+        assert requirement not in requirements
+
+
+def test_stale_lock_file_is_not_exported(grouped_project: Path):
+    pyproject = grouped_project / "pyproject.toml"
+    pyproject.write_text(
+        pyproject.read_text().replace('idna = "*"', 'idna = "*"\nurllib3 = "*"')
+    )
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+
+    with pytest.raises(ValueError, match="Run `poetry lock`"):
+        ExportEngine(plugin.poetry, NullIO()).render(plugin.configs[0])
+    assert plugin.export_all(NullIO(), "lock") == 1
+    assert not (grouped_project / "requirements.txt").exists()
+
+
+def test_locked_packages_loaded_once(mocker: MockerFixture, grouped_project: Path):
+    engine = ExportEngine(Application().poetry, NullIO())
+    spy = mocker.spy(Locker, "locked_packages")
+
+    engine.render(Export.from_config({"output": "requirements.txt"}))
+    engine.render(
+        Export.from_config({"output": "requirements-dev.txt", "only": ["dev"]})
+    )
+
+    assert spy.call_count == 1
+
+
+def test_parallel_renders_match_serial(grouped_project: Path):
+    """Exports rendered concurrently from one engine match those rendered one by one."""
+    exports = [
+        Export.from_config({"output": "requirements.txt"}),
+        Export.from_config({"output": "requirements-dev.txt", "with": ["dev"]}),
+        Export.from_config({"output": "requirements-only-dev.txt", "only": ["dev"]}),
+    ]
+    serial_engine = ExportEngine(Application().poetry, NullIO())
+    expected = [serial_engine.render(export) for export in exports]
+
+    parallel_engine = ExportEngine(Application().poetry, NullIO())
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        rendered = list(pool.map(parallel_engine.render, exports))
+
+    assert rendered == expected
+
+
+@pytest.fixture
+def package_index(mocker: MockerFixture, grouped_project: Path):
+    """Look up the URLs of locked files without a request to the index."""
+
+    def package(name, version, repository_name=None):
+        lock_data = Application().poetry.locker.lock_data
+        (entry,) = (entry for entry in lock_data["package"] if entry["name"] == name)
+        files = [
+            {**file, "url": f"https://files.example/{file['file']}"}
+            for file in entry["files"]
+        ]
+        return mocker.Mock(files=files)
+
+    return mocker.patch.object(RepositoryPool, "package", side_effect=package)
+
+
+@requires_pylock
+def test_render_pylock(package_index):
+    engine = ExportEngine(Application().poetry, NullIO())
+
+    pylock = tomlkit.parse(
+        engine.render(
+            Export.from_config(
+                {"output": "pylock.toml", "format": "pylock.toml", "with": ["dev"]}
+            )
+        )
+    )
+
+    assert [package["name"] for package in pylock["packages"]] == ["certifi", "idna"]
+    (wheel,) = pylock["packages"][1]["wheels"]
+    assert wheel["url"] == "https://files.example/idna-3.7-py3-none-any.whl"
+    assert "sha256" in wheel["hashes"]
+
+
+@requires_pylock
+def test_packages_looked_up_once(package_index):
+    engine = ExportEngine(Application().poetry, NullIO())
+
+    engine.render(
+        Export.from_config({"output": "pylock.toml", "format": "pylock.toml"})
+    )
+    engine.render(
+        Export.from_config(
+            {"output": "pylock.dev.toml", "format": "pylock.toml", "with": ["dev"]}
+        )
+    )
+
+    assert package_index.call_count == 2
+
+
+@requires_pylock
+def test_export_pylock(package_index, grouped_project: Path):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {}
+    plugin.configs = [
+        Export.from_config({"output": "pylock.toml", "format": "pylock.toml"})
+    ]
+
+    assert plugin.export_all(NullIO(), "lock") == 0
+
+    pylock = (grouped_project / "pylock.toml").read_text()
+    assert pylock.startswith("# poetry.lock hash: ")
+    assert tomlkit.parse(pylock)["lock-version"] == "1.0"
+    args = ["python", script_path, "poetry.lock", "pylock.toml"]
+    assert subprocess.call(args, cwd=grouped_project) == 0
+
+
+@pytest.mark.parametrize("output", ["pylock.toml", "locks/pylock.dev.toml"])
+def test_pylock_output_name(output: str):
+    assert Export.from_config({"output": output, "format": "pylock.toml"})
+
+
+@pytest.mark.parametrize(
+    "output",
+    ["requirements.toml", "pylock.a.b.toml", "pylock..toml", "dev.pylock.toml"],
+)
+def test_invalid_pylock_output_name(output: str):
+    with pytest.raises(ValueError, match="must be named"):
+        Export.from_config({"output": output, "format": "pylock.toml"})
+
+
+def test_pylock_requires_recent_exporter(mocker: MockerFixture, export_engine):
+    mocker.patch.object(Exporter, "is_format_supported", return_value=False)
+
+    with pytest.raises(ValueError, match="poetry-plugin-export 1.10"):
+        export_engine.render(
+            Export.from_config({"output": "pylock.toml", "format": "pylock.toml"})
+        )
+
+
+@pytest.mark.parametrize(
+    "option",
+    [
+        {"incremental": True},
+        {"fingerprint": "content"},
+        {"split": "native"},
+        {"shards": 2},
+    ],
+)
+def test_pylock_is_exported_as_is(option: dict):
+    with pytest.raises(ValueError, match="require a requirements.txt"):
+        Export.from_config({"output": "pylock.toml", "format": "pylock.toml", **option})
@@ -0,0 +1,145 @@
+from pathlib import Path
+
+import pytest
+from cleo.events.console_command_event import ConsoleCommandEvent
+from poetry.console.application import Application
+from poetry.console.commands.lock import LockCommand
+
+from poetry_auto_export import incremental
+from poetry_auto_export.config import Export
+from poetry_auto_export.exporter import ExportEngine
+from poetry_auto_export.plugin import PoetryAutoExport
+
+BODY = (
+    'certifi==2024.6.2 ; python_version >= "3.10" \\\n'
+    "    --hash=sha256:abc\n"
+    'idna==3.7 ; python_version >= "3.10"\n'
+    "mypackage @ file:///src/mypackage\n"
+)
+
+
+def lock(*packages: str, version: str = "2.1", python: str = "^3.10") -> str:
+    entries = "".join(f"[[package]]\n{package}\n" for package in packages)
+    return (
+        f"{entries}\n[metadata]\n"
+        f'lock-version = "{version}"\npython-versions = "{python}"\n'
+    )
+
+
+def test_changed_packages():
+    certifi = 'name = "certifi"\nversion = "2024.6.2"\ngroups = ["dev"]\n'
+    idna = 'name = "idna"\nversion = "3.7"\ngroups = ["main"]\n'
+    old = lock(certifi, idna, 'name = "Old_Package"\nversion = "1.0"\n')
+    new = lock(
+        certifi.replace("2024.6.2", "2024.7.4"), idna, 'name = "new"\nversion = "1"\n'
+    )
+
+    assert incremental.changed_packages(old, new) == {"certifi", "old-package", "new"}
+
+
+@pytest.mark.parametrize(
+    "new",
+    [lock(version="2.0"), lock(python="^3.11")],
+)
+def test_changed_packages_requires_comparable_locks(new: str):
+    assert incremental.changed_packages(lock(), new) is None
+
+
+def test_plan_patch():
+    kept = incremental.plan_patch(BODY, {"certifi"})
+
+    assert kept == [
+        'idna==3.7 ; python_version >= "3.10"',
+        "mypackage @ file:///src/mypackage",
+    ]
+
+
+def test_plan_patch_needs_a_package_per_entry():
+    body = "--extra-index-url https://example.com/simple\n\n" + BODY
+
+    assert incremental.plan_patch(body, {"certifi"}) is None
+
+
+def test_merge():
+    kept = incremental.plan_patch(BODY, {"certifi"})
+    rendered = (
+        'certifi==2024.7.4 ; python_version >= "3.10" \\\n    --hash=sha256:def\n'
+    )
+
+    assert incremental.merge(kept, rendered) == BODY.replace(
+        "2024.6.2", "2024.7.4"
+    ).replace("abc", "def")
+
+
+def lock_command(plugin: PoetryAutoExport, event, dispatcher, change=None):
+    """Run the plugin around a lock command which applies `change` to poetry.lock."""
+    plugin.activate(Application())
+    plugin.remember_lock(ConsoleCommandEvent(LockCommand(), event.io), "", dispatcher)
+    if change:
+        lock_file = Path("poetry.lock")
+        lock_file.write_text(lock_file.read_text().replace(*change))
+    plugin.run_exports(event, "", dispatcher)
+
+
+@pytest.fixture
+def incremental_plugin(grouped_project: Path, event, dispatcher) -> PoetryAutoExport:
+    """A project with an incremental export, exported from the current poetry.lock."""
+    plugin = PoetryAutoExport()
+    plugin.configs = [
+        Export.from_config(
+            {"output": "requirements.txt", "with": ["dev"], "incremental": True}
+        )
+    ]
+    plugin.settings = {"report": "report.json"}
+    lock_command(plugin, event, dispatcher)
+    return plugin
+
+
+def full_export(event) -> str:
+    engine = ExportEngine(Application().poetry, event.io)
+    return engine.render(
+        Export.from_config({"output": "requirements.txt", "with": ["dev"]})
+    )
+
+
+def test_incremental_export(incremental_plugin, event, dispatcher, mocker):
+    render = mocker.spy(ExportEngine, "render")
+
+    lock_command(incremental_plugin, event, dispatcher, ("2024.6.2", "2024.7.4"))
+
+    # Only the changed package was rendered
+    ((_, _, entries),) = [call.args for call in render.call_args_list]
+    assert [entry["name"] for entry in entries] == ["certifi"]
+    assert '"status": "patched"' in Path("report.json").read_text()
+    header, body = (
+        Path("requirements.txt")
+        .read_text()
+        .split("poetry.lock file is printed above\n")
+    )
+    assert "# export content hash: " in header
+    assert body == full_export(event)
+    assert "certifi==2024.7.4" in body
+
+
+def test_incremental_export_after_edit(incremental_plugin, event, dispatcher, mocker):
+    requirements = Path("requirements.txt")
+    requirements.write_text(requirements.read_text().replace("idna==", "idna>="))
+    render = mocker.spy(ExportEngine, "render")
+
+    lock_command(incremental_plugin, event, dispatcher, ("2024.6.2", "2024.7.4"))
+
+    # The whole file was exported again
+    ((_, _),) = [call.args for call in render.call_args_list]
+    assert '"status": "exported"' in Path("report.json").read_text()
+    assert requirements.read_text().endswith(full_export(event))
+
+
+def test_invalid_incremental_option(plugin: PoetryAutoExport):
+    with pytest.raises(ValueError, match="incremental"):
+        plugin._parse_pyproject_section(
+            {
+                "output": "requirements.txt",
+                "incremental": True,
+                "fingerprint": "content",
+            }
+        )
@@ -1,22 +1,29 @@
 import hashlib
+import json
+import subprocess
+import sys
+import threading
 from pathlib import Path
+from unittest.mock import Mock, PropertyMock
 
 import pytest
 import tomlkit
 from cleo.commands.command import Command
-from cleo.io.outputs.output import Output
+from cleo.io.null_io import NullIO
 from poetry.console.application import Application
+from poetry.console.commands.add import AddCommand
+from poetry.console.commands.lock import LockCommand
+from poetry.console.commands.remove import RemoveCommand
+from poetry.console.commands.update import UpdateCommand
+from poetry_plugin_export.command import ExportCommand
 from pytest_mock import MockerFixture
 from tomlkit.container import Container
 
-from poetry_auto_export.plugin import (
-    AddCommand,
-    ExportCommand,
-    LockCommand,
-    PoetryAutoExport,
-    RemoveCommand,
-    UpdateCommand,
-)
+from poetry_auto_export import chunks
+from poetry_auto_export import plugin as plugin_module
+from poetry_auto_export.config import Export
+from poetry_auto_export.locks import SUPPORTED, FileLock
+from poetry_auto_export.plugin import PoetryAutoExport
 from tests.conftest import FIXTURES_DIR
 
 
@@ -45,7 +52,9 @@ from tests.conftest import FIXTURES_DIR
 def test_config_parsing(data, expected, plugin: PoetryAutoExport):
     container = Container()
     container.update(data)
-    assert plugin._parse_pyproject(container) == expected
+    assert plugin._parse_pyproject(container) == [
+        Export.from_config(export) for export in expected
+    ]
 
 
 @pytest.mark.parametrize(
@@ -80,7 +89,9 @@ def test_config_parsing(data, expected, plugin: PoetryAutoExport):
 def test_nested_config_parsing(data, expected, plugin: PoetryAutoExport):
     container = Container()
     container.update(data)
-    assert plugin._parse_pyproject(container) == expected
+    assert plugin._parse_pyproject(container) == [
+        Export.from_config(export) for export in expected
+    ]
 
 
 @pytest.mark.parametrize(
@@ -102,6 +113,8 @@ def test_invalid_config_parsing_exports(data, plugin: PoetryAutoExport):
     [
         {"tool": {"poetry-auto-export": "invalid"}},
         {"tool": {"poetry-auto-export": {"output": 1}}},
+        {"output": "requirements.txt", "with": "dev"},
+        {"output": "requirements.txt", "without_hashes": "yes"},
     ],
 )
 def test_invalid_config_parsing(data, plugin: PoetryAutoExport):
@@ -111,6 +124,21 @@ def test_invalid_config_parsing(data, plugin: PoetryAutoExport):
         plugin._parse_pyproject_section(container)
 
 
+def test_config_parsing_can_be_repeated(plugin: PoetryAutoExport):
+    pyproject = tomlkit.parse((FIXTURES_DIR / "multiple_pyproject.toml").read_text())
+
+    configs = plugin._parse_pyproject(pyproject)
+
+    assert plugin._parse_pyproject(pyproject) == configs
+
+
+def test_with_option_alias():
+    export = Export.from_config({"output": "requirements.txt", "with": ["dev"]})
+
+    assert export.with_groups == ("dev",)
+    assert export.options() == {"with": ["dev"]}
+
+
 @pytest.mark.parametrize(
     "config, args",
     [
@@ -150,8 +178,8 @@ def test_invalid_config_parsing(data, plugin: PoetryAutoExport):
         ),
     ],
 )
-def test_prepare_export_args(config, args, plugin: PoetryAutoExport):
-    assert plugin._prepare_export_args(config, Output()) == args
+def test_export_args(config, args):
+    assert Export.from_config(config).args() == args
 
 
 def test_export_skips_random_event(plugin: PoetryAutoExport, dispatcher, event):
@@ -167,33 +195,27 @@ def test_export_skips_on_export(plugin: PoetryAutoExport, dispatcher, event):
 @pytest.mark.parametrize(
     "command", [LockCommand, UpdateCommand, AddCommand, RemoveCommand]
 )
-def test_export_triggers(
-    mocker: MockerFixture, command, plugin: PoetryAutoExport, dispatcher, event
-):
+def test_export_triggers(engine, command, plugin: PoetryAutoExport, dispatcher, event):
     event._command = command()
-    event.command.call = mocker.Mock()
 
     plugin.run_exports(event, "", dispatcher)
 
     assert event.io.write_line.call_count >= 1
-    assert event.command.call.call_count == 1
+    assert engine.render.call_count == 1
 
 
-def test_multiple_exports(
-    mocker: MockerFixture, plugin: PoetryAutoExport, dispatcher, event
-):
+def test_multiple_exports(engine, plugin: PoetryAutoExport, dispatcher, event):
     event._command = LockCommand()
-    event.command.call = mocker.Mock()
     plugin.configs = [
-        {"output": "requirements.txt"},
-        {"output": "requirements-dev.txt", "without": ["dev"]},
+        Export.from_config({"output": "requirements.txt"}),
+        Export.from_config({"output": "requirements-dev.txt", "without": ["dev"]}),
     ]
 
     plugin.run_exports(event, "", dispatcher)
 
     assert event.io.write_line.call_count >= 1
-    assert event.command.call.call_count == 2
-    assert event.command.call.call_count == 2
+    assert engine.render.call_count == 2
+    assert engine.render.call_count == 2
 
 
 def test_config_loading_from_pyproject(plugin: PoetryAutoExport):
@@ -222,18 +244,58 @@ def test_activate_current_directory(plugin: PoetryAutoExport):
     assert len(application.event_dispatcher._listeners) == listeners_count + 1
 
 
-def test_activate_no_pyproject_present(cwd_without_pyproject, plugin: PoetryAutoExport):
+def test_activate_no_pyproject_present(
+    cwd_without_pyproject, engine, event, dispatcher
+):
+    plugin = PoetryAutoExport()
     application = Application()
-    assert application.event_dispatcher
-    listeners_count = len(application.event_dispatcher._listeners)
 
     plugin.activate(application)
+    plugin.run_exports(event, "", dispatcher)
+
+    assert engine.render.call_count == 0
+
+
+def test_invalid_poetry_config_is_reported(mocker: MockerFixture):
+    error = RuntimeError("The Poetry configuration is invalid")
+    mocker.patch.object(
+        Application, "poetry", new_callable=PropertyMock, side_effect=error
+    )
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+
+    with pytest.raises(RuntimeError, match="is invalid"):
+        _ = plugin.configs
+    with pytest.raises(RuntimeError, match="is invalid"):
+        _ = plugin.settings
+
+
+def test_activate_does_not_load_project(
+    mocker: MockerFixture, plugin: PoetryAutoExport
+):
+    """Activation runs on every poetry command, so it must not load pyproject.toml."""
+    poetry = mocker.patch.object(Application, "poetry", new_callable=PropertyMock)
 
-    assert len(application.event_dispatcher._listeners) == listeners_count
+    plugin.activate(Application())
+
+    assert poetry.call_count == 0
+
+
+def test_import_does_not_load_export_machinery():
+    """Importing the plugin must not pull in poetry-plugin-export or the commands."""
+    code = (
+        "import sys, poetry_auto_export; "
+        "print(sorted(m for m in sys.modules if m.startswith("
+        "('poetry_plugin_export', 'poetry.console.commands', 'poetry.packages'))))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
 
 
 def test_hash_generation(
-    mocker: MockerFixture,
+    engine,
     basic_project: Path,
     event,
     dispatcher,
@@ -242,10 +304,9 @@ def test_hash_generation(
     # Given
     application = Application()
     event._command = LockCommand()
-    event.command.call = mocker.Mock()
     lock_file_path = basic_project / "poetry.lock"
     requirements_path = basic_project / "requirements.txt"
-    requirements_path.write_text("Example requirements file")
+    engine.render.return_value = "Example requirements file\n"
     lock_hash = hashlib.sha1(lock_file_path.read_bytes()).hexdigest()
 
     # When
@@ -259,3 +320,395 @@ def test_hash_generation(
 
     first_line = requirements_text.split("\n")[0]
     assert first_line == f"# poetry.lock hash: {lock_hash}"
+
+
+def test_options_hash_normalization(plugin: PoetryAutoExport):
+    reference = plugin._compute_options_hash(
+        Export.from_config({"output": "requirements.txt", "without": ["dev", "test"]})
+    )
+
+    assert reference == plugin._compute_options_hash(
+        Export.from_config(
+            {"output": "other.txt", "without": ["test", "dev"], "without_hashes": False}
+        )
+    )
+    assert reference != plugin._compute_options_hash(
+        Export.from_config({"output": "requirements.txt", "without": ["dev"]})
+    )
+
+
+def test_export_skipped_when_up_to_date(
+    engine,
+    basic_project: Path,
+    event,
+    dispatcher,
+    plugin: PoetryAutoExport,
+):
+    # Given
+    application = Application()
+    event._command = LockCommand()
+    (basic_project / "requirements.txt").write_text("Example requirements file")
+    plugin.activate(application)
+    plugin.run_exports(event, "", dispatcher)
+    assert engine.render.call_count == 1
+
+    # When
+    plugin.run_exports(event, "", dispatcher)
+
+    # Then
+    assert engine.render.call_count == 1
+
+
+def test_export_reruns_when_options_change(
+    engine,
+    basic_project: Path,
+    event,
+    dispatcher,
+    plugin: PoetryAutoExport,
+):
+    # Given
+    application = Application()
+    event._command = LockCommand()
+    (basic_project / "requirements.txt").write_text("Example requirements file")
+    plugin.activate(application)
+    plugin.run_exports(event, "", dispatcher)
+
+    # When
+    plugin.configs = [
+        Export.from_config({"output": "requirements.txt", "without": ["dev"]})
+    ]
+    plugin.run_exports(event, "", dispatcher)
+
+    # Then
+    assert engine.render.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        ({"tool": {}}, {}),
+        ({"tool": {"poetry-auto-export": {"output": "requirements.txt"}}}, {}),
+        ({"tool": {"poetry-auto-export": {"jobs": 4}}}, {"jobs": 4}),
+    ],
+)
+def test_settings_parsing(data, expected, plugin: PoetryAutoExport):
+    container = Container()
+    container.update(data)
+    assert plugin._parse_settings(container) == expected
+
+
+@pytest.mark.parametrize("jobs", [0, -1, "4", True])
+def test_invalid_jobs_setting(jobs, plugin: PoetryAutoExport):
+    container = Container()
+    container.update({"tool": {"poetry-auto-export": {"jobs": jobs}}})
+    with pytest.raises(ValueError):
+        plugin._parse_settings(container)
+
+
+def test_settings_are_not_export_options(plugin: PoetryAutoExport):
+    container = Container()
+    container.update(
+        {
+            "tool": {
+                "poetry-auto-export": {
+                    "jobs": 2,
+                    "exports": [{"output": "requirements.txt"}],
+                }
+            }
+        }
+    )
+    assert plugin._parse_pyproject(container) == [Export(output="requirements.txt")]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_parallel_exports(engine, plugin: PoetryAutoExport, dispatcher, event, jobs):
+    plugin.settings = {"jobs": jobs}
+    plugin.configs = [
+        Export.from_config({"output": f"requirements-{i}.txt"}) for i in range(5)
+    ]
+
+    plugin.run_exports(event, "", dispatcher)
+
+    exported = sorted(call.args[0].output for call in engine.render.call_args_list)
+    assert exported == [f"requirements-{i}.txt" for i in range(5)]
+    assert event.exit_code == 0
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_failed_export_is_reported(
+    engine, plugin: PoetryAutoExport, dispatcher, event, jobs
+):
+    def render(config):
+        if config.output == "broken.txt":
+            raise ValueError("Group not found: missing")
+        return ""
+
+    engine.render.side_effect = render
+    event.io.write_error_line = Mock()
+    plugin.settings = {"jobs": jobs}
+    plugin.configs = [
+        Export.from_config({"output": "requirements.txt"}),
+        Export.from_config({"output": "broken.txt", "with": ["missing"]}),
+        Export.from_config({"output": "requirements-dev.txt"}),
+    ]
+
+    plugin.run_exports(event, "", dispatcher)
+
+    assert engine.render.call_count == 3
+    assert event.exit_code == 1
+    message = event.io.write_error_line.call_args.args[0]
+    assert "broken.txt" in message
+    assert "Group not found: missing" in message
+
+
+def test_write_export_replaces_file(tmp_path: Path, plugin: PoetryAutoExport):
+    out_file = tmp_path / "requirements.txt"
+    out_file.write_text("old content\n")
+    out_file.chmod(0o640)
+
+    assert plugin._write_export(out_file, "new content\n")
+
+    assert out_file.read_text() == "new content\n"
+    assert out_file.stat().st_mode & 0o777 == 0o640
+    assert [p.name for p in tmp_path.iterdir()] == ["requirements.txt"]
+
+
+def test_write_export_keeps_unchanged_file(tmp_path: Path, plugin: PoetryAutoExport):
+    out_file = tmp_path / "requirements.txt"
+    out_file.write_text("same content\n")
+    mtime = out_file.stat().st_mtime_ns
+    inode = out_file.stat().st_ino
+
+    assert not plugin._write_export(out_file, "same content\n")
+
+    assert out_file.stat().st_mtime_ns == mtime
+    assert out_file.stat().st_ino == inode
+
+
+def test_write_export_in_chunks(
+    tmp_path: Path, plugin: PoetryAutoExport, mocker: MockerFixture
+):
+    mocker.patch.object(chunks, "CHUNK_SIZE", 4)
+    out_file = tmp_path / "requirements.txt"
+    header, body = "# poetry.lock hash: abc\n", "certifi==2024.6.2\nidna==3.7\n"
+
+    assert plugin._write_export(out_file, header, body)
+    assert out_file.read_text() == header + body
+    assert not plugin._write_export(out_file, header, body)
+    # A file which only starts with, or is only the start of the export, is replaced
+    assert plugin._write_export(out_file, header, body[:-1])
+    assert plugin._write_export(out_file, header, body)
+    assert plugin._compute_content_hash(body) == hashlib.sha1(body.encode()).hexdigest()
+
+
+@pytest.mark.parametrize(
+    "content, count",
+    [
+        ("", 0),
+        ("--index-url https://pypi.org/simple\n\ncertifi==2024.6.2 \\\n", 1),
+        ("idna==3.7 \\\n    --hash=sha256:abc\n-e ./local\nrequests==2.32.3", 3),
+        ('lock-version = "1.0"\n\n[[packages]]\nname = "a"\n\n[[packages]]\n', 2),
+    ],
+)
+def test_count_packages(content: str, count: int):
+    assert plugin_module._count_packages(content) == count
+
+
+def test_write_export_cleans_up_on_failure(
+    mocker: MockerFixture, tmp_path: Path, plugin: PoetryAutoExport
+):
+    out_file = tmp_path / "requirements.txt"
+    out_file.write_text("old content\n")
+    mocker.patch("os.replace", side_effect=OSError("disk full"))
+
+    with pytest.raises(OSError):
+        plugin._write_export(out_file, "new content\n")
+
+    assert out_file.read_text() == "old content\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["requirements.txt"]
+
+
+def test_export_end_to_end(basic_project: Path, event, dispatcher):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+
+    plugin.run_exports(event, "", dispatcher)
+
+    lines = (basic_project / "requirements.txt").read_text().splitlines()
+    assert lines[0].startswith("# poetry.lock hash: ")
+    assert lines[1].startswith("# export options hash: ")
+    assert any(line.startswith("requests==2.32.3 ; ") for line in lines)
+
+
+@pytest.mark.parametrize("algorithm", ["sha1", "sha256", "blake2b"])
+def test_lock_hash_algorithm(
+    engine, basic_project: Path, event, dispatcher, algorithm: str
+):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"hash_algorithm": algorithm}
+    lock_hash = hashlib.new(
+        algorithm, (basic_project / "poetry.lock").read_bytes()
+    ).hexdigest()
+
+    plugin.run_exports(event, "", dispatcher)
+
+    assert plugin._read_header(basic_project / "requirements.txt")[:2] == (
+        algorithm,
+        lock_hash,
+    )
+
+
+def test_invalid_hash_algorithm_setting(plugin: PoetryAutoExport):
+    container = Container()
+    container.update({"tool": {"poetry-auto-export": {"hash_algorithm": "md5"}}})
+    with pytest.raises(ValueError):
+        plugin._parse_settings(container)
+
+
+def test_content_fingerprint_ignores_unrelated_lock_changes(
+    grouped_project: Path, event, dispatcher
+):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.configs = [
+        Export.from_config(
+            {"output": "requirements.txt", "without": ["dev"], "fingerprint": "content"}
+        )
+    ]
+    plugin.run_exports(event, "", dispatcher)
+    requirements = grouped_project / "requirements.txt"
+    assert requirements.read_text().startswith("# export content hash: ")
+    stat = requirements.stat()
+
+    # When a package of the excluded dev group is bumped
+    lock_file = grouped_project / "poetry.lock"
+    lock_file.write_text(lock_file.read_text().replace("2024.6.2", "2024.7.4"))
+    plugin.run_exports(event, "", dispatcher)
+
+    # Then
+    assert (requirements.stat().st_ino, requirements.stat().st_mtime_ns) == (
+        stat.st_ino,
+        stat.st_mtime_ns,
+    )
+
+
+def test_invalid_fingerprint_option(plugin: PoetryAutoExport):
+    with pytest.raises(ValueError):
+        plugin._parse_pyproject_section(
+            {"output": "requirements.txt", "fingerprint": "invalid"}
+        )
+
+
+@pytest.mark.skipif(not SUPPORTED, reason="needs POSIX file locks")
+def test_concurrent_writes_are_serialized(engine, basic_project: Path):
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {}
+    other_run = FileLock(plugin._write_lock(basic_project / "requirements.txt"))
+    other_run.acquire()
+
+    export = threading.Thread(target=plugin.export_all, args=(NullIO(), "lock"))
+    export.start()
+    export.join(0.2)
+    assert export.is_alive()
+    assert not (basic_project / "requirements.txt").exists()
+
+    other_run.release()
+    export.join()
+    assert (basic_project / "requirements.txt").exists()
+    assert not list(basic_project.glob(".*.lock"))
+
+
+def test_export_of_outdated_lock_is_not_written(engine, basic_project: Path):
+    """When another poetry run changes poetry.lock meanwhile, its export wins."""
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"report": "export.json"}
+    lock_file = basic_project / "poetry.lock"
+
+    def render(export):
+        lock_file.write_text(lock_file.read_text() + "\n")
+        return "Placeholder value\n"
+
+    engine.render.side_effect = render
+
+    assert plugin.export_all(NullIO(), "lock") == 0
+
+    assert not (basic_project / "requirements.txt").exists()
+    (target,) = json.loads(Path("export.json").read_text())["targets"]
+    assert target["status"] == "superseded"
+
+    engine.render.side_effect = None
+    assert plugin.export_all(NullIO(), "lock") == 0
+    assert (basic_project / "requirements.txt").exists()
+
+
+def test_export_report(engine, plugin: PoetryAutoExport, dispatcher, event, mocker):
+    def render(config):
+        if config.output == "broken.txt":
+            raise ValueError("Group not found: missing")
+        return "certifi==2024.6.2 \\\n    --hash=sha256:abc\nidna==3.7\n"
+
+    engine.render.side_effect = render
+    event.io.write_error_line = Mock()
+    mocker.patch.object(plugin, "_compute_poetry_lock_hash", return_value="abc123")
+    plugin.settings = {"report": "reports/export.json"}
+    plugin.configs = [
+        Export.from_config({"output": "requirements.txt", "fingerprint": "content"}),
+        Export.from_config({"output": "broken.txt", "with": ["missing"]}),
+    ]
+    # Exported before, the content fingerprint makes it render again
+    options_hash = plugin._compute_options_hash(plugin.configs[0])
+    plugin._run_export(engine, plugin.configs[0], "abc123", options_hash)
+
+    plugin.configs.append(Export.from_config({"output": "requirements-dev.txt"}))
+    plugin.run_exports(event, "", dispatcher)
+
+    report = json.loads(Path("reports/export.json").read_text())
+    assert report["command"] == "lock"
+    assert report["exit_code"] == 1
+    assert report["lock_hash"] == "abc123"
+    assert set(report["durations"]) == {"lock_hash", "total"}
+    unchanged, failed, exported = report["targets"]
+    assert unchanged["status"] == "unchanged"
+    assert unchanged["bytes"] == 0
+    assert failed["status"] == "failed"
+    assert failed["error"] == "Group not found: missing"
+    assert exported["status"] == "exported"
+    assert exported["packages"] == 2
+    assert exported["bytes"] == Path("requirements-dev.txt").stat().st_size
+    assert set(exported["durations"]) == {"check", "render", "header", "write"}
+
+
+def test_export_report_skipped_target(
+    engine, plugin: PoetryAutoExport, dispatcher, event, mocker
+):
+    mocker.patch.object(plugin, "_compute_poetry_lock_hash", return_value="abc123")
+    plugin.settings = {"report": "export.json"}
+    plugin.run_exports(event, "", dispatcher)
+
+    plugin.run_exports(event, "", dispatcher)
+
+    (target,) = json.loads(Path("export.json").read_text())["targets"]
+    assert target["status"] == "skipped"
+    assert set(target["durations"]) == {"check"}
+
+
+def test_invalid_profile_setting(plugin: PoetryAutoExport):
+    pyproject = {"tool": {"poetry-auto-export": {"profile": 1}}}
+    with pytest.raises(ValueError, match="profile must be a boolean or a path"):
+        plugin._parse_settings(pyproject)  # type: ignore
+
+
+def test_invalid_report_setting(plugin: PoetryAutoExport):
+    pyproject = {"tool": {"poetry-auto-export": {"report": True}}}
+    with pytest.raises(ValueError, match="report must be a path"):
+        plugin._parse_settings(pyproject)  # type: ignore
+
+
+@pytest.mark.parametrize("key", ["stat_cache", "background"])
+def test_invalid_boolean_setting(plugin: PoetryAutoExport, key: str):
+    pyproject = {"tool": {"poetry-auto-export": {key: "yes"}}}
+    with pytest.raises(ValueError, match=f"{key} must be a boolean"):
+        plugin._parse_settings(pyproject)  # type: ignore
@@ -0,0 +1,98 @@
+import pstats
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from cleo.io.buffered_io import BufferedIO
+from poetry.console.application import Application
+
+from poetry_auto_export import profiling
+from poetry_auto_export.config import Export
+from poetry_auto_export.plugin import PoetryAutoExport
+
+
+@pytest.fixture
+def profiled_plugin(engine, basic_project: Path) -> PoetryAutoExport:
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"jobs": 2}
+    plugin.configs = [
+        Export.from_config({"output": "requirements.txt"}),
+        Export.from_config({"output": "deps/requirements-dev.txt", "with": ["dev"]}),
+    ]
+    (basic_project / "deps").mkdir()
+    return plugin
+
+
+def test_profile_setting(profiled_plugin: PoetryAutoExport, basic_project: Path):
+    profiled_plugin.settings["profile"] = "profiles"
+    io = BufferedIO()
+
+    assert profiled_plugin.export_all(io, "lock") == 0
+
+    lock_hash = profiled_plugin._compute_poetry_lock_hash()
+    files = sorted(path.name for path in (basic_project / "profiles").iterdir())
+    assert len(files) == 3
+    assert all(f"-{lock_hash[:12]}-" in name for name in files)
+    run, _, main = (
+        next(name for name in files if name.endswith(suffix))
+        for suffix in (
+            "-run.pstats",
+            "-deps_requirements-dev.txt.pstats",
+            "-requirements.txt.pstats",
+        )
+    )
+    # The run includes its targets
+    run_stats = pstats.Stats(str(basic_project / "profiles" / run))
+    main_stats = pstats.Stats(str(basic_project / "profiles" / main))
+    assert run_stats.total_tt >= main_stats.total_tt  # type: ignore[attr-defined]
+    assert "poetry-auto-export" in io.fetch_output()
+
+
+def test_profile_environment_variable(
+    profiled_plugin: PoetryAutoExport, basic_project: Path, monkeypatch
+):
+    monkeypatch.setenv(profiling.ENV_VAR, "1")
+
+    assert profiled_plugin.export_all(BufferedIO(), "lock") == 0
+
+    assert len(list((basic_project / profiling.DEFAULT_DIRECTORY).iterdir())) == 3
+
+
+def test_not_profiled_by_default(
+    profiled_plugin: PoetryAutoExport, basic_project: Path, monkeypatch
+):
+    monkeypatch.delenv(profiling.ENV_VAR, raising=False)
+
+    assert profiled_plugin.export_all(BufferedIO(), "lock") == 0
+
+    assert not (basic_project / profiling.DEFAULT_DIRECTORY).exists()
+
+
+def test_attribute():
+    plugin_file = "/site-packages/poetry_auto_export/plugin.py"
+    stats = SimpleNamespace(
+        stats={
+            (plugin_file, 1, "run_exports"): (1, 1, 0.5, 3.0, {}),
+            ("/site-packages/poetry/core/version.py", 1, "parse"): (1, 1, 1.0, 1.0, {}),
+            ("/site-packages/poetry/packages/locker.py", 1, "load"): (
+                *(1, 1, 0.25, 0.25),
+                {},
+            ),
+            ("~", 0, "<method 'write' of '_io.TextIOWrapper' objects>"): (
+                *(2, 2, 1.5, 1.5),
+                {
+                    (plugin_file, 1, "run_exports"): (1, 1, 1.0, 1.0),
+                    ("/usr/lib/python3/json/encoder.py", 1, "dump"): (1, 1, 0.5, 0.5),
+                },
+            ),
+        }
+    )
+
+    assert profiling.attribute(stats) == {  # type: ignore[arg-type]
+        "poetry-auto-export": 1.5,
+        "poetry-plugin-export": 0.0,
+        "poetry-core": 1.0,
+        "poetry": 0.25,
+        "other": 0.5,
+    }
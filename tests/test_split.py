@@ -0,0 +1,122 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+from cleo.io.null_io import NullIO
+from poetry.console.application import Application
+from poetry_plugin_export.exporter import Exporter
+from pytest_mock import MockerFixture
+
+from poetry_auto_export.config import Export
+from poetry_auto_export.exporter import ExportEngine
+from poetry_auto_export.plugin import PoetryAutoExport
+from tests.test_check_requirements_file import script_path
+
+
+def entries(path: Path) -> list[str]:
+    """The names of the packages in an exported file, without its header."""
+    return [
+        line.split("==")[0]
+        for line in path.read_text().splitlines()
+        if line and not line.startswith(("#", " "))
+    ]
+
+
+@pytest.fixture
+def split_plugin(basic_project: Path) -> PoetryAutoExport:
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {}
+    return plugin
+
+
+def test_parts():
+    export = Export.from_config({"output": "deps/requirements.txt", "shards": 3})
+
+    assert [part.output for part in export.parts()] == [
+        "deps/requirements-1.txt",
+        "deps/requirements-2.txt",
+        "deps/requirements-3.txt",
+    ]
+    assert Export.from_config({"output": "requirements.txt"}).parts() == [
+        Export.from_config({"output": "requirements.txt"})
+    ]
+
+
+def test_native_split(basic_project: Path, split_plugin: PoetryAutoExport):
+    split_plugin.configs = [
+        Export.from_config({"output": "requirements.txt", "split": "native"})
+    ]
+
+    assert split_plugin.export_all(NullIO(), "lock") == 0
+
+    assert not (basic_project / "requirements.txt").exists()
+    assert entries(basic_project / "requirements-native.txt") == ["charset-normalizer"]
+    assert entries(basic_project / "requirements-pure.txt") == [
+        "certifi",
+        "idna",
+        "requests",
+        "urllib3",
+    ]
+
+
+def test_shards(
+    basic_project: Path, split_plugin: PoetryAutoExport, mocker: MockerFixture
+):
+    split_plugin.configs = [
+        Export.from_config({"output": "requirements.txt", "shards": 2})
+    ]
+    export = mocker.spy(Exporter, "export")
+
+    assert split_plugin.export_all(NullIO(), "lock") == 0
+
+    # The heaviest package gets a shard of its own
+    assert entries(basic_project / "requirements-1.txt") == ["charset-normalizer"]
+    assert len(entries(basic_project / "requirements-2.txt")) == 4
+    assert export.call_count == 1
+
+
+def test_parts_add_up_to_the_whole_export(
+    basic_project: Path, split_plugin: PoetryAutoExport
+):
+    engine = ExportEngine(split_plugin.poetry, NullIO())
+    export = Export.from_config({"output": "requirements.txt", "shards": 3})
+    lock_hash = split_plugin._compute_poetry_lock_hash()
+
+    whole = engine.render(export)
+    body = "".join(
+        split_plugin._render_export(engine, part, lock_hash)[1]
+        for part in export.parts()
+    )
+    assert sorted(body.splitlines()) == sorted(whole.splitlines())
+
+
+def test_parts_are_checked(basic_project: Path, split_plugin: PoetryAutoExport):
+    split_plugin.configs = [
+        Export.from_config({"output": "requirements.txt", "shards": 2})
+    ]
+    split_plugin.export_all(NullIO(), "lock")
+    args = ["python", script_path, "--glob", "requirements-*.txt"]
+
+    assert subprocess.call(args, cwd=basic_project) == 0
+    assert split_plugin.export_all(NullIO(), "lock") == 0
+    assert split_plugin.check_all(NullIO()) == 0
+
+    lock_file = basic_project / "poetry.lock"
+    lock_file.write_text(lock_file.read_text() + " ")
+    assert subprocess.call(args, cwd=basic_project) == 1
+
+
+@pytest.mark.parametrize(
+    "config, message",
+    [
+        ({"split": "size"}, "split must be one of: native"),
+        ({"shards": 0}, "shards must be a positive integer"),
+        ({"shards": True}, "shards must be a positive integer"),
+        ({"split": "native", "shards": 2}, "split and shards can't be combined"),
+        ({"shards": 2, "incremental": True}, "incremental exports can't be split"),
+    ],
+)
+def test_invalid_split(config: dict, message: str):
+    with pytest.raises(ValueError, match=message):
+        Export.from_config({"output": "requirements.txt", **config})
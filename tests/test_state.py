@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+from pathlib import Path
+
+from poetry.console.application import Application
+from pytest_mock import MockerFixture
+
+from poetry_auto_export import plugin as plugin_module
+from poetry_auto_export.plugin import PoetryAutoExport
+from poetry_auto_export.state import STATE_FILE, StatCache, file_stat
+from tests.test_check_requirements_file import script_path
+
+AN_HOUR_AGO = 3600 * 10**9
+
+
+def make_old(path: Path):
+    """Move the modification time of a file back, so its recorded stat is trusted."""
+    mtime = path.stat().st_mtime_ns - AN_HOUR_AGO
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_stat_cache_digest(tmp_path: Path):
+    lock_file = tmp_path / "poetry.lock"
+    lock_file.write_text("content")
+    make_old(lock_file)
+    cache = StatCache(tmp_path / STATE_FILE)
+    cache.record_digest(lock_file, file_stat(lock_file), "sha1", "abc")
+    cache.save()
+
+    assert StatCache(tmp_path / STATE_FILE).digest(lock_file, "sha1") == "abc"
+
+    lock_file.write_text("changed")
+    assert StatCache(tmp_path / STATE_FILE).digest(lock_file, "sha1") is None
+
+
+def test_stat_cache_ignores_recently_modified_files(tmp_path: Path):
+    lock_file = tmp_path / "poetry.lock"
+    lock_file.write_text("content")
+    cache = StatCache(tmp_path / STATE_FILE)
+
+    cache.record_digest(lock_file, file_stat(lock_file), "sha1", "abc")
+
+    assert cache.digest(lock_file, "sha1") is None
+
+
+def test_unchanged_exports_are_not_opened(
+    engine, basic_project: Path, event, dispatcher, mocker: MockerFixture
+):
+    make_old(basic_project / "poetry.lock")
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"stat_cache": True}
+    plugin.run_exports(event, "", dispatcher)
+    make_old(basic_project / "requirements.txt")
+    plugin.run_exports(event, "", dispatcher)
+    read_header = mocker.spy(PoetryAutoExport, "_read_header")
+    file_digest = mocker.spy(plugin_module, "_file_digest")
+
+    plugin.run_exports(event, "", dispatcher)
+
+    assert engine.render.call_count == 1
+    assert read_header.call_count == 0
+    assert file_digest.call_count == 0
+
+
+def test_checker_uses_recorded_lock_hash(
+    engine, basic_project: Path, event, dispatcher
+):
+    lock_file = basic_project / "poetry.lock"
+    make_old(lock_file)
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"stat_cache": True}
+    plugin.run_exports(event, "", dispatcher)
+    assert subprocess.call(["python", script_path], cwd=basic_project) == 0
+
+    # A recorded hash is used as long as poetry.lock is unchanged
+    state_file = basic_project / STATE_FILE
+    state = json.loads(state_file.read_text())
+    state["files"][str(lock_file)]["hashes"]["sha1"] = "outdated"
+    state_file.write_text(json.dumps(state))
+    assert subprocess.call(["python", script_path], cwd=basic_project) == 1
+
+    # Once poetry.lock changes, it is hashed and recorded again
+    make_old(lock_file)
+    assert subprocess.call(["python", script_path], cwd=basic_project) == 0
+    assert "outdated" not in state_file.read_text()
+
+
+def test_checker_detects_changed_options(
+    engine, basic_project: Path, event, dispatcher
+):
+    make_old(basic_project / "poetry.lock")
+    plugin = PoetryAutoExport()
+    plugin.activate(Application())
+    plugin.settings = {"stat_cache": True}
+    plugin.run_exports(event, "", dispatcher)
+    make_old(basic_project / "requirements.txt")
+    plugin.run_exports(event, "", dispatcher)
+    assert subprocess.call(["python", script_path], cwd=basic_project) == 0
+
+    pyproject = basic_project / "pyproject.toml"
+    pyproject.write_text(pyproject.read_text().replace("without_hashes = true\n", ""))
+
+    assert subprocess.call(["python", script_path], cwd=basic_project) == 1